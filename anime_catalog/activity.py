@@ -0,0 +1,80 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, FloatField, Sum, Value
+from django.db.models.functions import Cast, Power
+from .cache import KEY_PREFIX
+from .models import ActivityBucket
+
+
+BUCKET_SECONDS = 3600
+ACTIVITY_WEIGHTS = {
+    'comment': 1,
+    'rating': 1,
+    'collection': 2,
+    'review': 3,
+}
+TRENDING_MAX_LIMIT = 50
+
+
+def current_bucket():
+    # Hours since the epoch
+    return int(time.time()) // BUCKET_SECONDS
+
+
+def increment_activity(kind, anime_ids):
+    # Adds to the current hour of every anime: one UPDATE, plus an insert and a second UPDATE for the
+    # anime without a row yet this hour
+    bucket, weight = current_bucket(), ACTIVITY_WEIGHTS[kind]
+    with transaction.atomic():
+        rows = ActivityBucket.objects.filter(bucket=bucket, anime_id__in=anime_ids)
+        if rows.update(count=F('count') + weight) < len(anime_ids):
+            existing = set(rows.values_list('anime_id', flat=True))
+            missing = anime_ids - existing
+            ActivityBucket.objects.bulk_create(
+                [ActivityBucket(anime_id=anime_id, bucket=bucket) for anime_id in missing], ignore_conflicts=True
+            )
+            ActivityBucket.objects.filter(bucket=bucket, anime_id__in=missing).update(count=F('count') + weight)
+
+
+def record_activity(kind, anime_ids):
+    # Counted once the write commits, in a transaction of its own: the (anime, bucket) row of a popular
+    # anime takes every write to it this hour, so its lock must not be held for the rest of the caller's
+    # transaction. Rolled back writes are not counted.
+    anime_ids = set(anime_ids)
+    if anime_ids:
+        transaction.on_commit(lambda: increment_activity(kind, anime_ids))
+
+
+def compute_trending(limit, bucket=None):
+    # sum(count * 2^((bucket - now) / half_life)) over the window: one GROUP BY on activity_bucket_idx.
+    # Scores are in "events this hour" units.
+    bucket = current_bucket() if bucket is None else bucket
+    window, half_life = settings.TRENDING_WINDOW_HOURS, settings.TRENDING_HALF_LIFE_HOURS
+
+    age = Cast(F('bucket') - Value(bucket), FloatField()) / Value(float(half_life))
+    decayed = Cast(F('count'), FloatField()) * Power(Value(2.0), age)
+    rows = (
+        ActivityBucket.objects.filter(bucket__gt=bucket - window, bucket__lte=bucket)
+        .values('anime_id')
+        .annotate(score=Sum(decayed, output_field=FloatField()))
+        .order_by('-score', '-anime_id')
+        .values_list('anime_id', 'score')
+    )
+    return [(anime_id, round(score, 4)) for anime_id, score in rows[:limit]]
+
+
+def get_trending(limit):
+    # Shared by every request within TRENDING_CACHE_TIMEOUT, and never older than the current hour
+    bucket = current_bucket()
+    key = f'{KEY_PREFIX}:trending:{bucket}:{limit}'
+    trending = cache.get(key)
+    if trending is None:
+        trending = compute_trending(limit, bucket)
+        cache.set(key, trending, settings.TRENDING_CACHE_TIMEOUT)
+    return trending
+
+
+def prune_activity():
+    return ActivityBucket.objects.filter(bucket__lte=current_bucket() - settings.TRENDING_WINDOW_HOURS).delete()[0]
@@ -0,0 +1,208 @@
+from django.db import transaction
+from django.db.models import Count, F
+from .activity import record_activity
+from .models import Anime, Profile, Rating, RatingAggregate, Review, ReviewAggregate, REVIEW_DIMENSIONS, REVIEW_GRADES
+
+
+RATES = range(1, 11)
+
+
+def apply_rating_delta(anime_id, rate, delta):
+    changes = {
+        'count': F('count') + delta,
+        'total': F('total') + delta * rate,
+        f'rate_{rate}': F(f'rate_{rate}') + delta,
+    }
+    updated = RatingAggregate.objects.filter(anime_id=anime_id).update(**changes)
+
+    if not updated and delta > 0:
+        # Row missing (e.g. created outside the Anime post_save signal), create it and retry
+        RatingAggregate.objects.get_or_create(anime_id=anime_id)
+        RatingAggregate.objects.filter(anime_id=anime_id).update(**changes)
+
+
+def record_rating(anime_id, rate):
+    apply_rating_delta(anime_id, rate, 1)
+
+
+def discard_rating(anime_id, rate):
+    apply_rating_delta(anime_id, rate, -1)
+
+
+def replace_rating(previous_anime_id, previous_rate, anime_id, rate):
+    if (previous_anime_id, previous_rate) == (anime_id, rate):
+        return
+
+    with transaction.atomic():
+        discard_rating(previous_anime_id, previous_rate)
+        record_rating(anime_id, rate)
+
+
+def lock_profile(profile_id):
+    # Serializes one user's upserts. The previous rows they read may not exist yet and so can't be locked:
+    # two concurrent first writes of the same pair would both count as created.
+    list(Profile.objects.select_for_update().filter(pk=profile_id).values_list('pk', flat=True))
+
+
+def upsert_ratings(profile_id, rates):
+    # rates: {anime_id: rate}. One INSERT ... ON CONFLICT for the ratings and one UPDATE pass over the
+    # aggregates of the anime whose rating actually changed.
+    with transaction.atomic():
+        lock_profile(profile_id)
+        previous = dict(
+            Rating.objects.select_for_update()
+            .filter(for_user_id=profile_id, for_anime_id__in=rates)
+            .values_list('for_anime_id', 'rate')
+        )
+        # bulk_create sends no post_save, so the aggregate signals don't fire twice
+        Rating.objects.bulk_create(
+            [Rating(for_user_id=profile_id, for_anime_id=anime_id, rate=rate) for anime_id, rate in rates.items()],
+            update_conflicts=True,
+            unique_fields=['for_user', 'for_anime'],
+            update_fields=['rate'],
+        )
+
+        changed = {anime_id: rate for anime_id, rate in rates.items() if previous.get(anime_id) != rate}
+        if changed:
+            RatingAggregate.objects.bulk_create([RatingAggregate(anime_id=anime_id) for anime_id in changed], ignore_conflicts=True)
+            aggregates = list(RatingAggregate.objects.select_for_update().filter(anime_id__in=changed))
+            for aggregate in aggregates:
+                rate, old_rate = changed[aggregate.anime_id], previous.get(aggregate.anime_id)
+                if old_rate is None:
+                    aggregate.count += 1
+                else:
+                    aggregate.total -= old_rate
+                    setattr(aggregate, f'rate_{old_rate}', getattr(aggregate, f'rate_{old_rate}') - 1)
+                aggregate.total += rate
+                setattr(aggregate, f'rate_{rate}', getattr(aggregate, f'rate_{rate}') + 1)
+            RatingAggregate.objects.bulk_update(aggregates, ['count', 'total'] + [f'rate_{rate}' for rate in RATES])
+            # bulk_create skipped the Rating signals, which also feed trending
+            record_activity('rating', changed)
+
+    created = len(rates) - len(previous)
+    return {'created': created, 'updated': len(changed) - created, 'unchanged': len(rates) - len(changed)}
+
+
+def rebuild_rating_aggregates(anime_ids=None, batch_size=1000):
+    anime = Anime.objects.all()
+    ratings = Rating.objects.all()
+    if anime_ids is not None:
+        anime = anime.filter(id__in=anime_ids)
+        ratings = ratings.filter(for_anime_id__in=anime_ids)
+
+    aggregates = {}
+    for anime_id in anime.values_list('id', flat=True).iterator(chunk_size=batch_size):
+        aggregates[anime_id] = RatingAggregate(anime_id=anime_id)
+
+    # Count('rate') rather than the id keeps this answerable from the (for_anime, rate) index
+    for row in ratings.values('for_anime_id', 'rate').annotate(n=Count('rate')).order_by():
+        aggregate = aggregates.get(row['for_anime_id'])
+        if aggregate is None:
+            continue
+        aggregate.count += row['n']
+        aggregate.total += row['n'] * row['rate']
+        setattr(aggregate, f'rate_{row["rate"]}', row['n'])
+
+    fields = ['count', 'total'] + [f'rate_{rate}' for rate in RATES]
+    with transaction.atomic():
+        RatingAggregate.objects.bulk_create(
+            aggregates.values(),
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['anime'],
+            update_fields=fields,
+        )
+
+    return len(aggregates)
+
+
+def review_grades(review):
+    return {dimension: getattr(review, dimension) for dimension in REVIEW_DIMENSIONS}
+
+
+def apply_review_delta(anime_id, grades, delta):
+    changes = {'count': F('count') + delta}
+    for dimension, grade in grades.items():
+        changes[f'{dimension}_total'] = F(f'{dimension}_total') + delta * grade
+        changes[f'{dimension}_{grade}'] = F(f'{dimension}_{grade}') + delta
+    updated = ReviewAggregate.objects.filter(anime_id=anime_id).update(**changes)
+
+    if not updated and delta > 0:
+        ReviewAggregate.objects.get_or_create(anime_id=anime_id)
+        ReviewAggregate.objects.filter(anime_id=anime_id).update(**changes)
+
+
+def record_review(anime_id, grades):
+    apply_review_delta(anime_id, grades, 1)
+
+
+def discard_review(anime_id, grades):
+    apply_review_delta(anime_id, grades, -1)
+
+
+def replace_review(previous_anime_id, previous_grades, anime_id, grades):
+    if (previous_anime_id, previous_grades) == (anime_id, grades):
+        return
+
+    with transaction.atomic():
+        discard_review(previous_anime_id, previous_grades)
+        record_review(anime_id, grades)
+
+
+def upsert_review(review, update_fields):
+    # One INSERT ... ON CONFLICT (user, anime) DO UPDATE; bulk_create sends no signals, so the
+    # aggregate delta is applied here
+    with transaction.atomic():
+        lock_profile(review.user_id)
+        previous = (
+            Review.objects.select_for_update()
+            .filter(user_id=review.user_id, anime_id=review.anime_id)
+            .values(*REVIEW_DIMENSIONS)
+            .first()
+        )
+        Review.objects.bulk_create([review], update_conflicts=True, unique_fields=['user', 'anime'], update_fields=update_fields)
+
+        if previous is None:
+            record_review(review.anime_id, review_grades(review))
+            record_activity('review', [review.anime_id])
+        else:
+            replace_review(review.anime_id, previous, review.anime_id, review_grades(review))
+    return review
+
+
+def rebuild_review_aggregates(anime_ids=None, batch_size=1000):
+    anime = Anime.objects.all()
+    reviews = Review.objects.all()
+    if anime_ids is not None:
+        anime = anime.filter(id__in=anime_ids)
+        reviews = reviews.filter(anime_id__in=anime_ids)
+
+    aggregates = {}
+    for anime_id in anime.values_list('id', flat=True).iterator(chunk_size=batch_size):
+        aggregates[anime_id] = ReviewAggregate(anime_id=anime_id)
+
+    for anime_id, count in reviews.values('anime_id').annotate(n=Count('id')).order_by().values_list('anime_id', 'n'):
+        if anime_id in aggregates:
+            aggregates[anime_id].count = count
+    for dimension in REVIEW_DIMENSIONS:
+        rows = reviews.values('anime_id', dimension).annotate(n=Count('id')).order_by().values_list('anime_id', dimension, 'n')
+        for anime_id, grade, count in rows:
+            aggregate = aggregates.get(anime_id)
+            if aggregate is None:
+                continue
+            setattr(aggregate, f'{dimension}_total', getattr(aggregate, f'{dimension}_total') + grade * count)
+            setattr(aggregate, f'{dimension}_{grade}', count)
+
+    fields = ['count'] + [
+        f'{dimension}_{suffix}' for dimension in REVIEW_DIMENSIONS for suffix in ['total', *REVIEW_GRADES]
+    ]
+    with transaction.atomic():
+        ReviewAggregate.objects.bulk_create(
+            aggregates.values(),
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['anime'],
+            update_fields=fields,
+        )
+
+    return len(aggregates)
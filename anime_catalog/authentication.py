@@ -0,0 +1,133 @@
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from .cache import KEY_PREFIX
+from .models import Profile
+from .permissons import is_moderator
+
+
+PROFILE_ID_CLAIM = 'profile_id'
+MODERATOR_CLAIM = 'is_moderator'
+STAFF_CLAIM = 'is_staff'
+SUPERUSER_CLAIM = 'is_superuser'
+# When the claims were read, to the microsecond: iat has whole seconds, which can't order a token
+# against a role change in the same second
+CLAIMS_AT_CLAIM = 'claims_at'
+
+
+def get_user_claims(user):
+    # Stamped before the roles are read, so a change made while they are read revokes these claims
+    claims_at = time.time()
+    return {
+        PROFILE_ID_CLAIM: Profile.objects.filter(user_id=user.pk).values_list('pk', flat=True).first(),
+        MODERATOR_CLAIM: is_moderator(user),
+        STAFF_CLAIM: user.is_staff,
+        SUPERUSER_CLAIM: user.is_superuser,
+        CLAIMS_AT_CLAIM: claims_at,
+    }
+
+
+def trusts_role_claims(token):
+    # Revocations live in the cache: a per-process cache would leave the other workers trusting them
+    return settings.AUTH_TRUST_TOKEN_CLAIMS and MODERATOR_CLAIM in token
+
+
+def _active_key(user_id):
+    return f'{KEY_PREFIX}:auth:active:{user_id}'
+
+
+def _claims_not_before_key(user_id):
+    return f'{KEY_PREFIX}:auth:claims-not-before:{user_id}'
+
+
+def forget_account(*user_ids):
+    cache.delete_many([_active_key(user_id) for user_id in user_ids])
+
+
+def revoke_claims(*user_ids):
+    # Access tokens carrying claims read before now are refused; clients refresh to get current ones
+    timeout = int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+    cache.set_many({_claims_not_before_key(user_id): time.time() for user_id in user_ids}, timeout)
+
+
+def check_account(user_id, token):
+    active_key, not_before_key = _active_key(user_id), _claims_not_before_key(user_id)
+    stored = cache.get_many([active_key, not_before_key])
+
+    active = stored.get(active_key)
+    if active is None:
+        active = User.objects.filter(pk=user_id, is_active=True).exists()
+        cache.set(active_key, active, settings.AUTH_CACHE_TIMEOUT)
+    if not active:
+        raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+    not_before = stored.get(not_before_key)
+    if not_before is not None and trusts_role_claims(token) and token.get(CLAIMS_AT_CLAIM, 0) <= not_before:
+        raise AuthenticationFailed(_('Token claims are out of date'), code='token_not_valid')
+
+
+class CatalogTokenUser(TokenUser):
+    # Tokens issued without the catalog claims (e.g. a bare AccessToken.for_user), or whose role claims
+    # aren't trusted, fall back to the database
+    def __init__(self, token):
+        super().__init__(token)
+        if trusts_role_claims(token):
+            self._is_moderator = token[MODERATOR_CLAIM]
+
+    @cached_property
+    def _user(self):
+        return User.objects.get(pk=self.pk)
+
+    @cached_property
+    def is_staff(self):
+        return self.token[STAFF_CLAIM] if trusts_role_claims(self.token) else self._user.is_staff
+
+    @cached_property
+    def is_superuser(self):
+        return self.token[SUPERUSER_CLAIM] if trusts_role_claims(self.token) else self._user.is_superuser
+
+    @cached_property
+    def profile_id(self):
+        if PROFILE_ID_CLAIM in self.token:
+            return self.token[PROFILE_ID_CLAIM]
+        return Profile.objects.filter(user_id=self.pk).values_list('pk', flat=True).first()
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    # Builds the user from the token claims. The only per-request state is the cached account check,
+    # which refuses disabled accounts within AUTH_CACHE_TIMEOUT (immediately in the process that saved them).
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        check_account(user.pk, validated_token)
+        return user
+
+
+class CatalogRefreshToken(RefreshToken):
+    claims_loaded = False
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token.payload.update(get_user_claims(user))
+        token.claims_loaded = True
+        return token
+
+    @property
+    def access_token(self):
+        access = super().access_token
+        if not self.claims_loaded:
+            # A refresh token sent back by the client carries the claims it was issued with
+            user = User.objects.filter(pk=self[api_settings.USER_ID_CLAIM], is_active=True).first()
+            if user is None:
+                raise TokenError(_('User is inactive'))
+            access.payload.update(get_user_claims(user))
+        return access
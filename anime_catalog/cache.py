@@ -0,0 +1,94 @@
+import time
+from hashlib import md5
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+
+KEY_PREFIX = 'catalog'
+HITS_KEY = f'{KEY_PREFIX}:stats:hits'
+MISSES_KEY = f'{KEY_PREFIX}:stats:misses'
+
+
+def _generation_key(dependency):
+    return f'{KEY_PREFIX}:generation:{dependency}'
+
+
+def get_generations(dependencies):
+    keys = {dependency: _generation_key(dependency) for dependency in dependencies}
+    stored = cache.get_many(keys.values())
+
+    generations = []
+    for dependency, key in keys.items():
+        generation = stored.get(key)
+        if generation is None:
+            # A lost generation must never fall back to a value that older entries were stored under
+            generation = time.time_ns()
+            cache.add(key, generation, None)
+            generation = cache.get(key, generation)
+        generations.append(f'{dependency}={generation}')
+
+    return generations
+
+
+def invalidate(*dependencies):
+    generation = time.time_ns()
+    cache.set_many({_generation_key(dependency): generation for dependency in dependencies}, None)
+
+
+def build_response_key(request, dependencies):
+    query = sorted((key, sorted(values)) for key, values in request.query_params.lists())
+    raw = '|'.join([request.get_host(), request.path, urlencode(query, doseq=True)] + get_generations(dependencies))
+    return f'{KEY_PREFIX}:response:{md5(raw.encode()).hexdigest()}'
+
+
+def _increment(key):
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add and incr
+        cache.set(key, 1, None)
+
+
+def get_stats():
+    stats = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = stats.get(HITS_KEY, 0), stats.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_ratio': round(hits / total, 4) if total else None}
+
+
+class CachedResponseMixin:
+    # Caches anonymous GET responses. `cache_dependencies` name the models the response is built
+    # from and `cache_object_dependency` adds a per-object one (`<name>:<pk>`); the signals in
+    # signals.py invalidate them.
+    cache_dependencies = ()
+    cache_object_dependency = None
+
+    def get_cache_dependencies(self):
+        dependencies = list(self.cache_dependencies)
+        if self.cache_object_dependency:
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            dependencies.append(f'{self.cache_object_dependency}:{self.kwargs[lookup_url_kwarg]}')
+        return dependencies
+
+    def get(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().get(request, *args, **kwargs)
+
+        key = build_response_key(request, self.get_cache_dependencies())
+        data = cache.get(key)
+
+        if data is not None:
+            _increment(HITS_KEY)
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        _increment(MISSES_KEY)
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.CATALOG_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
@@ -0,0 +1,68 @@
+import csv
+import json
+from collections import defaultdict
+from django.db.models import F
+from .importer import CSV_GENRE_SEPARATOR, chunked
+from .models import Anime, Genre
+
+
+# The importer's columns plus the id, so an export can be fed back to import_anime
+EXPORT_FIELDS = (
+    'id', 'title', 'description', 'type', 'episodes', 'ready_episodes', 'length_of_episodes',
+    'status', 'age_rating', 'studio', 'genres', 'year',
+)
+CONTENT_TYPES = {
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def iter_anime(chunk_size=2000):
+    # One pass over Anime on a server-side cursor (on PostgreSQL). Each chunk costs one more query for
+    # its genre links; genre titles come from a dict loaded once and topped up when a chunk needs more.
+    genre_titles = dict(Genre.objects.values_list('id', 'title'))
+    columns = [field for field in EXPORT_FIELDS if field not in ('studio', 'genres')]
+    rows = Anime.objects.order_by('id').values(*columns, studio_title=F('studio__title'))
+
+    for chunk in chunked(rows.iterator(chunk_size=chunk_size), chunk_size):
+        links = Anime.genres.through.objects.filter(anime_id__in=[row['id'] for row in chunk])
+        links = list(links.order_by('anime_id', 'genre_id').values_list('anime_id', 'genre_id'))
+        # Genres created since the export started; links to genres deleted since are dropped
+        missing = {genre_id for _, genre_id in links if genre_id not in genre_titles}
+        if missing:
+            genre_titles.update(Genre.objects.filter(id__in=missing).values_list('id', 'title'))
+
+        genres = defaultdict(list)
+        for anime_id, genre_id in links:
+            if genre_id in genre_titles:
+                genres[anime_id].append(genre_titles[genre_id])
+
+        for row in chunk:
+            row['studio'] = row.pop('studio_title')
+            row['genres'] = genres[row['id']]
+            yield row
+
+
+class _Echo:
+    # csv.writer target that hands each line back instead of buffering it
+    def write(self, value):
+        return value
+
+
+def export_jsonl(rows):
+    for row in rows:
+        yield json.dumps({field: row[field] for field in EXPORT_FIELDS}, ensure_ascii=False) + '\n'
+
+
+def export_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        row['genres'] = CSV_GENRE_SEPARATOR.join(row['genres'])
+        yield writer.writerow([row[field] for field in EXPORT_FIELDS])
+
+
+def export_anime(format, chunk_size=2000):
+    # Lines of the whole catalog, produced lazily
+    rows = iter_anime(chunk_size)
+    return export_jsonl(rows) if format == 'jsonl' else export_csv(rows)
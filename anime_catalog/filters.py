@@ -0,0 +1,132 @@
+import time
+from django.db.models import Count
+from rest_framework.exceptions import ValidationError
+from .models import Anime, Genre, Studio
+
+
+class TitleIdCache:
+    # In-process title -> id map. Cleared by the model signals in this process; the timeout bounds how
+    # long other processes can keep serving a renamed or deleted title.
+    def __init__(self, model, timeout=300):
+        self.model = model
+        self.timeout = timeout
+        self._ids = {}
+
+    def resolve(self, titles):
+        now = time.monotonic()
+        resolved, missing = {}, []
+
+        for title in titles:
+            entry = self._ids.get(title)
+            if entry is not None and entry[1] > now:
+                resolved[title] = entry[0]
+            else:
+                missing.append(title)
+
+        if missing:
+            expires = now + self.timeout
+            for pk, title in self.model.objects.filter(title__in=missing).values_list('pk', 'title'):
+                self._ids[title] = (pk, expires)
+                resolved[title] = pk
+
+        return resolved
+
+    def clear(self):
+        self._ids = {}
+
+
+genre_ids = TitleIdCache(Genre)
+studio_ids = TitleIdCache(Studio)
+anime_ids = TitleIdCache(Anime)
+
+GENRE_MODES = ('any', 'all')
+
+
+def get_ids(params, id_param, title_param, cache, strict=False):
+    # None when neither parameter was given, otherwise every id named directly or by title.
+    # With `strict`, a single unknown title empties the result.
+    raw_ids = [value for value in params.getlist(id_param) if value]
+    titles = [value for value in params.getlist(title_param) if value]
+    if not raw_ids and not titles:
+        return None
+
+    try:
+        ids = {int(value) for value in raw_ids}
+    except ValueError:
+        raise ValidationError({id_param: 'A valid integer is required.'})
+
+    if titles:
+        resolved = cache.resolve(titles)
+        if strict and len(resolved) < len(set(titles)):
+            return set()
+        ids.update(resolved.values())
+    return ids
+
+
+def get_genres_mode(params):
+    genres_mode = params.get('genres_mode') or 'any'
+    if genres_mode not in GENRE_MODES:
+        raise ValidationError({'genres_mode': f"Must be one of: {', '.join(GENRE_MODES)}."})
+    return genres_mode
+
+
+def filter_anime(queryset, params):
+    genres_mode = get_genres_mode(params)
+
+    studios = get_ids(params, 'studio_id', 'studio', studio_ids)
+    genres = get_ids(params, 'genre_id', 'genres', genre_ids, strict=genres_mode == 'all')
+    status = params.get('status')
+    age_rating = params.get('age_rating')
+    year = params.get('year')
+    type = params.get('type')
+
+    if studios is not None:
+        queryset = queryset.filter(studio_id__in=studios) if studios else queryset.none()
+    if genres is not None:
+        queryset = filter_genres(queryset, genres, genres_mode) if genres else queryset.none()
+    if status:
+        queryset = queryset.filter(status=status)
+    if age_rating:
+        queryset = queryset.filter(age_rating=age_rating)
+    if year:
+        queryset = queryset.filter(year=year)
+    if type:
+        queryset = queryset.filter(type=type)
+
+    return queryset
+
+
+def filter_genres(queryset, genres, mode='any', field='id'):
+    # A semi-join on the through table: no join fan-out, so no duplicate rows and no DISTINCT needed.
+    # `all` keeps the anime matching every genre with a single GROUP BY ... HAVING COUNT = n.
+    # `field` is the anime id column of the filtered model.
+    matches = Anime.genres.through.objects.filter(genre_id__in=genres)
+    if mode == 'all':
+        matches = matches.values('anime_id').annotate(matched=Count('genre_id')).filter(matched=len(genres))
+
+    return queryset.filter(**{f'{field}__in': matches.values('anime_id')})
+
+
+def filter_leaderboard(queryset, params):
+    # Studio and year are columns of the entries themselves; genres go through the anime
+    genres_mode = get_genres_mode(params)
+    studios = get_ids(params, 'studio_id', 'studio', studio_ids)
+    genres = get_ids(params, 'genre_id', 'genres', genre_ids, strict=genres_mode == 'all')
+    year = params.get('year')
+
+    if studios is not None:
+        queryset = queryset.filter(studio_id__in=studios) if studios else queryset.none()
+    if genres is not None:
+        queryset = filter_genres(queryset, genres, genres_mode, field='anime_id') if genres else queryset.none()
+    if year:
+        queryset = queryset.filter(year=year)
+
+    return queryset
+
+
+def filter_by_anime(queryset, params):
+    anime = get_ids(params, 'anime_id', 'anime', anime_ids)
+
+    if anime is not None:
+        queryset = queryset.filter(anime_id__in=anime) if anime else queryset.none()
+    return queryset
@@ -0,0 +1,140 @@
+import csv
+import json
+import time
+from itertools import islice
+from django.db import IntegrityError, transaction
+from .cache import invalidate
+from .filters import anime_ids, genre_ids, studio_ids
+from .models import Anime, Genre, Studio, RatingAggregate, ReviewAggregate
+from .search import autocomplete_index, search_index
+from .serializers import AnimeImportSerializer
+
+
+FORMATS = ('jsonl', 'csv')
+CSV_GENRE_SEPARATOR = '|'
+
+
+class InvalidRow:
+    # Stands in for a line that could not be parsed, so it is counted and reported like a row that fails
+    # validation instead of aborting the import halfway
+    def __init__(self, errors):
+        self.errors = errors
+
+
+def read_jsonl(lines):
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as error:
+                yield InvalidRow({'non_field_errors': [f'Line {number} is not valid JSON: {error.msg}.']})
+
+
+def read_csv(lines):
+    for row in csv.DictReader(lines):
+        row['genres'] = [genre for genre in (row.get('genres') or '').split(CSV_GENRE_SEPARATOR) if genre]
+        yield row
+
+
+def read_rows(lines, format):
+    return read_jsonl(lines) if format == 'jsonl' else read_csv(lines)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def resolve_titles(model, titles):
+    # title -> id, creating the missing rows; one query when they all exist, three otherwise
+    ids = dict(model.objects.filter(title__in=titles).values_list('title', 'id'))
+    missing = [title for title in titles if title not in ids]
+    if missing:
+        model.objects.bulk_create([model(title=title) for title in missing], ignore_conflicts=True)
+        ids.update(model.objects.filter(title__in=missing).values_list('title', 'id'))
+    return ids
+
+
+def insert_anime(rows, studios):
+    # A concurrent import may commit some of these titles after the existence check. The unique index makes
+    # the insert wait for it and fail; those titles are then visible, so they are dropped and the rest retried.
+    while rows:
+        try:
+            with transaction.atomic():
+                return rows, Anime.objects.bulk_create([
+                    Anime(**{key: value for key, value in row.items() if key not in ('studio', 'genres')}, studio_id=studios[row['studio']])
+                    for row in rows
+                ])
+        except IntegrityError:
+            existing = set(Anime.objects.filter(title__in=[row['title'] for row in rows]).values_list('title', flat=True))
+            if not existing:
+                raise
+            rows = [row for row in rows if row['title'] not in existing]
+    return rows, []
+
+
+def import_chunk(rows):
+    # Rows are validated dicts; anime whose title already exists are skipped
+    with transaction.atomic():
+        existing = set(Anime.objects.filter(title__in=[row['title'] for row in rows]).values_list('title', flat=True))
+        rows = [row for row in rows if row['title'] not in existing]
+        if not rows:
+            return 0
+
+        studios = resolve_titles(Studio, {row['studio'] for row in rows})
+        genres = resolve_titles(Genre, {genre for row in rows for genre in row['genres']})
+
+        rows, anime = insert_anime(rows, studios)
+        Anime.genres.through.objects.bulk_create([
+            Anime.genres.through(anime_id=item.id, genre_id=genres[genre])
+            for item, row in zip(anime, rows)
+            for genre in set(row['genres'])
+        ])
+        # bulk_create sends no post_save, so do what the Anime signal would
+        RatingAggregate.objects.bulk_create([RatingAggregate(anime_id=item.id) for item in anime], ignore_conflicts=True)
+        ReviewAggregate.objects.bulk_create([ReviewAggregate(anime_id=item.id) for item in anime], ignore_conflicts=True)
+
+    return len(anime)
+
+
+def import_anime(rows, batch_size=1000, max_errors=100):
+    # Streams `rows` in chunks of batch_size: memory stays flat whatever the input size
+    started = time.perf_counter()
+    result = {'read': 0, 'created': 0, 'skipped': 0, 'invalid': 0, 'errors': []}
+
+    try:
+        for chunk in chunked(rows, batch_size):
+            valid, invalid = {}, 0
+            for row in chunk:
+                result['read'] += 1
+                if isinstance(row, InvalidRow):
+                    errors = row.errors
+                else:
+                    serializer = AnimeImportSerializer(data=row)
+                    errors = None if serializer.is_valid() else serializer.errors
+                if errors is not None:
+                    invalid += 1
+                    if len(result['errors']) < max_errors:
+                        result['errors'].append({'row': result['read'], 'errors': errors})
+                    continue
+                # Repeated titles within a chunk: the first one wins
+                valid.setdefault(serializer.validated_data['title'], serializer.validated_data)
+
+            created = import_chunk(list(valid.values()))
+            result['created'] += created
+            result['invalid'] += invalid
+            result['skipped'] += len(chunk) - invalid - created
+    finally:
+        if result['created']:
+            invalidate('anime', 'studio', 'genre')
+            for cache in (anime_ids, studio_ids, genre_ids):
+                cache.clear()
+            search_index.invalidate()
+            autocomplete_index.invalidate()
+
+    elapsed = time.perf_counter() - started
+    result['seconds'] = round(elapsed, 3)
+    result['rows_per_second'] = round(result['read'] / elapsed) if elapsed else None
+    return result
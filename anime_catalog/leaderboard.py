@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .cache import KEY_PREFIX, invalidate
+from .models import Anime, LeaderboardEntry, RatingAggregate, ReviewAggregate
+
+
+MEAN_KEY = f'{KEY_PREFIX}:leaderboard:mean'
+# Review.final_grade is out of 5, ratings out of 10
+REVIEW_GRADE_SCALE = 2
+# The site-wide mean is only replaced once it moves this much, so one new vote doesn't rewrite every row
+MEAN_TOLERANCE = 0.01
+SCORE_DIGITS = 4
+
+
+def collect_votes():
+    # anime_id -> [count, total] on the 1..10 scale, read from the rating and review aggregates
+    votes = {
+        anime_id: [count, total]
+        for anime_id, count, total in RatingAggregate.objects.filter(count__gt=0).values_list('anime_id', 'count', 'total')
+    }
+    reviews = ReviewAggregate.objects.filter(count__gt=0).values_list('anime_id', 'count', 'final_grade_total')
+    for anime_id, count, total in reviews:
+        entry = votes.setdefault(anime_id, [0, 0])
+        entry[0] += count
+        entry[1] += total * REVIEW_GRADE_SCALE
+    return votes
+
+
+def weighted_score(count, total, mean, min_votes):
+    # IMDb weighted rating (v*R + m*C) / (v + m): the anime's average is pulled toward the site-wide mean C
+    # until it has well over min_votes votes
+    return round((total + min_votes * mean) / (count + min_votes), SCORE_DIGITS)
+
+
+def get_mean(votes):
+    count = sum(count for count, _ in votes.values())
+    mean = sum(total for _, total in votes.values()) / count if count else 0
+
+    previous = cache.get(MEAN_KEY)
+    if previous is not None and abs(previous - mean) < MEAN_TOLERANCE:
+        return previous
+    cache.set(MEAN_KEY, mean, None)
+    return mean
+
+
+def refresh_leaderboard(min_votes=None, batch_size=1000):
+    # Recomputes every score from the per-anime aggregates (O(anime), not O(votes)) and writes only the
+    # entries that changed
+    min_votes = settings.LEADERBOARD_MIN_VOTES if min_votes is None else min_votes
+    votes = collect_votes()
+    mean = get_mean(votes)
+
+    rows = {}
+    for anime_id, studio_id, year in Anime.objects.values_list('id', 'studio_id', 'year').iterator(chunk_size=batch_size):
+        if anime_id in votes:
+            count, total = votes[anime_id]
+            rows[anime_id] = (studio_id, year, weighted_score(count, total, mean, min_votes), round(total / count, SCORE_DIGITS), count)
+
+    fields = ('studio_id', 'year', 'score', 'average', 'votes')
+    existing = LeaderboardEntry.objects.values_list('id', 'anime_id', *fields)
+    changed, stale = [], []
+    for pk, anime_id, *values in existing.iterator(chunk_size=batch_size):
+        row = rows.pop(anime_id, None)
+        if row is None:
+            stale.append(pk)
+        elif tuple(values) != row:
+            changed.append(LeaderboardEntry(id=pk, anime_id=anime_id, **dict(zip(fields, row))))
+    created = [LeaderboardEntry(anime_id=anime_id, **dict(zip(fields, row))) for anime_id, row in rows.items()]
+
+    with transaction.atomic():
+        LeaderboardEntry.objects.bulk_create(created, batch_size=batch_size)
+        LeaderboardEntry.objects.bulk_update(changed, [field.removesuffix('_id') for field in fields], batch_size=batch_size)
+        for start in range(0, len(stale), batch_size):
+            LeaderboardEntry.objects.filter(id__in=stale[start:start + batch_size]).delete()
+
+    if created or changed or stale:
+        invalidate('leaderboard')
+    return {'created': len(created), 'updated': len(changed), 'deleted': len(stale), 'mean': mean}
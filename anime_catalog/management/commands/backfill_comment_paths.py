@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from anime_catalog.threads import backfill_comment_paths
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the materialized path, depth and reply count of every comment.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = backfill_comment_paths(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Backfilled the paths of {updated} comments.'))
@@ -0,0 +1,184 @@
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from rest_framework.request import Request
+from anime_catalog.models import Anime, Genre, Studio
+from anime_catalog.search import autocomplete, autocomplete_index
+from anime_catalog.views import FullAnimeListAPIView
+
+
+TYPES = ('TV', 'Movie', 'OVA', 'ONA', 'Special')
+STATUSES = ('Ongoing', 'Completed', 'Announced')
+AGE_RATINGS = ('G', 'PG', 'PG-13', 'R', 'R+')
+
+
+class Command(BaseCommand):
+    help = 'Seeds a throwaway catalog and times the FullAnimeListAPIView filters, with and without the Anime indexes, and autocomplete.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--anime', type=int, default=200000)
+        parser.add_argument('--studios', type=int, default=500)
+        parser.add_argument('--genres', type=int, default=40)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--genre-counts', type=int, nargs='*', default=[5, 10],
+            help='Number of genres selected in the any/all genre filter scenarios.',
+        )
+        parser.add_argument('--compare', action='store_true', help='Also time every scenario with the Anime indexes dropped.')
+        parser.add_argument('--plans', action='store_true', help='Print the query plan of every scenario.')
+        parser.add_argument('--keep', action='store_true', help='Commit the seeded rows instead of rolling them back.')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.random = random.Random(options['seed'])
+
+        with transaction.atomic():
+            started = time.perf_counter()
+            self.seed()
+            self.stdout.write(f"Seeded {options['anime']} anime in {time.perf_counter() - started:.1f}s")
+
+            before = None
+            if options['compare']:
+                with self.indexes_dropped():
+                    before = self.run_scenarios('without indexes')
+            after = self.run_scenarios('with indexes')
+            self.report(before, after)
+            self.run_autocomplete()
+
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+    def seed(self):
+        batch_size = self.options['batch_size']
+        studios = Studio.objects.bulk_create(
+            [Studio(title=f'Benchmark Studio {i}') for i in range(self.options['studios'])], batch_size=batch_size
+        )
+        genres = Genre.objects.bulk_create(
+            [Genre(title=f'Benchmark Genre {i}') for i in range(self.options['genres'])], batch_size=batch_size
+        )
+        self.studio_titles = [studio.title for studio in studios]
+        self.genre_titles = [genre.title for genre in genres]
+
+        through = Anime.genres.through
+        for start in range(0, self.options['anime'], batch_size):
+            stop = min(start + batch_size, self.options['anime'])
+            anime = Anime.objects.bulk_create([
+                Anime(
+                    title=f'Benchmark Anime {i}',
+                    description='x' * 100,
+                    type=self.random.choice(TYPES),
+                    episodes=12,
+                    ready_episodes=12,
+                    length_of_episodes=24,
+                    status=self.random.choice(STATUSES),
+                    age_rating=self.random.choice(AGE_RATINGS),
+                    studio=self.random.choice(studios),
+                    year=self.random.randint(1960, 2023),
+                ) for i in range(start, stop)
+            ])
+            through.objects.bulk_create([
+                through(anime_id=item.id, genre_id=genre.id)
+                for item in anime
+                for genre in self.random.sample(genres, self.random.randint(1, min(6, len(genres))))
+            ])
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                for model in (Anime, through, Studio, Genre):
+                    cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+    def get_scenarios(self):
+        studio = self.studio_titles[0]
+        genres = self.genre_titles[:2]
+        scenarios = [
+            {'status': 'Ongoing'},
+            {'age_rating': 'R'},
+            {'year': '2015'},
+            {'type': 'Movie'},
+            {'studio': studio},
+            {'type': 'TV', 'status': 'Ongoing'},
+            {'year': '2015', 'type': 'TV'},
+            {'genres': genres},
+            {'type': 'TV', 'status': 'Completed', 'genres': genres},
+        ]
+        for count in self.options['genre_counts']:
+            selected = self.genre_titles[:count]
+            scenarios.append({'genres': selected, 'genres_mode': 'any'})
+            scenarios.append({'genres': selected, 'genres_mode': 'all'})
+
+        return scenarios
+
+    def build_queryset(self, params):
+        view = FullAnimeListAPIView(request=Request(RequestFactory().get('/', params)), kwargs={}, format_kwarg=None)
+        return view.filter_queryset(view.get_queryset())
+
+    def run_scenarios(self, label):
+        results = {}
+
+        for params in self.get_scenarios():
+            queryset = self.build_queryset(params)
+            timings = []
+            for _ in range(self.options['repeat']):
+                # What one page of the endpoint costs: the page itself plus the paginator's count
+                started = time.perf_counter()
+                list(queryset[:10])
+                queryset.count()
+                timings.append((time.perf_counter() - started) * 1000)
+
+            name = _describe(params)
+            results[name] = statistics.median(timings)
+            if self.options['plans']:
+                explain_options = {'analyze': True} if connection.vendor == 'postgresql' else {}
+                self.stdout.write(f'\n[{label}] {name}\n{queryset[:10].explain(**explain_options)}')
+
+        return results
+
+    def run_autocomplete(self):
+        autocomplete_index.invalidate()
+        started = time.perf_counter()
+        autocomplete('b')
+        self.stdout.write(f'\nautocomplete warm-up (trie build off PostgreSQL): {(time.perf_counter() - started) * 1000:.2f}ms')
+
+        self.stdout.write(f"{'autocomplete prefix':<72}{'ms':>14}")
+        for prefix in ('b', 'bench', 'anime 12', 'studio 4', 'benchmark anime 1999'):
+            timings = []
+            for _ in range(self.options['repeat']):
+                started = time.perf_counter()
+                autocomplete(prefix)
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(f'{prefix:<72}{statistics.median(timings):>14.2f}')
+
+    @contextmanager
+    def indexes_dropped(self):
+        editor = connection.schema_editor(collect_sql=True)
+        indexes = Anime._meta.indexes
+
+        with connection.cursor() as cursor:
+            for index in indexes:
+                cursor.execute(str(index.remove_sql(Anime, editor)))
+            yield
+            for index in indexes:
+                cursor.execute(str(index.create_sql(Anime, editor)))
+
+    def report(self, before, after):
+        self.stdout.write('')
+        header = f"{'scenario':<72}{'without idx ms':>16}{'with idx ms':>14}" if before else f"{'scenario':<72}{'ms':>14}"
+        self.stdout.write(header)
+
+        for name, elapsed in after.items():
+            if before:
+                self.stdout.write(f'{name:<72}{before[name]:>16.2f}{elapsed:>14.2f}')
+            else:
+                self.stdout.write(f'{name:<72}{elapsed:>14.2f}')
+
+
+def _describe(params):
+    return ' & '.join(
+        f'{key}={len(value)} titles' if isinstance(value, list) else f'{key}={value}' for key, value in params.items()
+    )
@@ -0,0 +1,126 @@
+import random
+import statistics
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import RequestFactory
+from anime_catalog.aggregates import rebuild_rating_aggregates
+from anime_catalog.models import Anime, Profile, Rating, Studio
+from anime_catalog.views import AnimeAverageRatingView, AnimeRatingDistributionView
+
+
+class Command(BaseCommand):
+    help = 'Seeds a throwaway set of users and ratings and times the average-rating and rating-count endpoints.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--anime', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=40000)
+        parser.add_argument('--per-user', type=int, default=50, help='Ratings per user; the total is users * per-user.')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--plans', action='store_true', help='Print the plan of the per-anime distribution query.')
+        parser.add_argument('--keep', action='store_true', help='Commit the seeded rows instead of rolling them back.')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.random = random.Random(options['seed'])
+
+        with transaction.atomic():
+            started = time.perf_counter()
+            count = self.seed()
+            self.stdout.write(f'Seeded {count} ratings in {time.perf_counter() - started:.1f}s')
+
+            started = time.perf_counter()
+            rebuild_rating_aggregates(self.anime_ids, batch_size=options['batch_size'])
+            self.stdout.write(f'Rebuilt {len(self.anime_ids)} rating aggregates in {time.perf_counter() - started:.1f}s')
+
+            self.report()
+
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+    def seed(self):
+        batch_size = self.options['batch_size']
+        studio = Studio.objects.create(title='Benchmark Ratings Studio')
+        self.anime_ids = [anime.id for anime in Anime.objects.bulk_create([
+            Anime(
+                title=f'Benchmark Rated Anime {i}',
+                description='x' * 100,
+                type='TV',
+                episodes=12,
+                ready_episodes=12,
+                length_of_episodes=24,
+                status='Completed',
+                age_rating='PG-13',
+                studio=studio,
+                year=2020,
+            ) for i in range(self.options['anime'])
+        ], batch_size=batch_size)]
+
+        # A few popular titles collect most of the ratings, as on the real site
+        weights = [1 / (rank + 1) for rank in range(len(self.anime_ids))]
+        per_user = min(self.options['per_user'], len(self.anime_ids))
+        count = 0
+        for start in range(0, self.options['users'], batch_size):
+            stop = min(start + batch_size, self.options['users'])
+            users = User.objects.bulk_create(
+                [User(username=f'benchmark-rater-{i}', password='!') for i in range(start, stop)]
+            )
+            profiles = Profile.objects.bulk_create([
+                Profile(user=user, nickname=user.username, birth_date='2000-01-01', sex=Profile.OTHER)
+                for user in users
+            ])
+
+            ratings = []
+            for profile in profiles:
+                anime_ids = set()
+                while len(anime_ids) < per_user:
+                    anime_ids.update(self.random.choices(self.anime_ids, weights, k=per_user - len(anime_ids)))
+                ratings.extend(
+                    Rating(for_user_id=profile.id, for_anime_id=anime_id, rate=self.random.randint(1, 10))
+                    for anime_id in anime_ids
+                )
+            Rating.objects.bulk_create(ratings, batch_size=batch_size)
+            count += len(ratings)
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                for model in (Rating, Profile, Anime):
+                    cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+        return count
+
+    def time(self, function):
+        timings = []
+        for _ in range(self.options['repeat']):
+            anime_id = self.random.choice(self.anime_ids[:10])
+            started = time.perf_counter()
+            function(anime_id)
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def report(self):
+        factory = RequestFactory()
+        average = AnimeAverageRatingView.as_view()
+        distribution = AnimeRatingDistributionView.as_view()
+
+        def distribution_query(anime_id):
+            return list(Rating.objects.filter(for_anime_id=anime_id).values('rate').annotate(n=Count('rate')).order_by())
+
+        scenarios = {
+            'average-rating endpoint (aggregate row)': lambda anime_id: average(factory.get('/'), pk=anime_id).render(),
+            'rating-count endpoint (aggregate row)': lambda anime_id: distribution(factory.get('/'), pk=anime_id).render(),
+            'distribution from Rating (rating_anime_rate_idx)': distribution_query,
+        }
+
+        self.stdout.write(f"\n{'scenario, most rated anime':<72}{'ms':>14}")
+        for name, function in scenarios.items():
+            self.stdout.write(f'{name:<72}{self.time(function):>14.2f}')
+
+        if self.options['plans']:
+            queryset = Rating.objects.filter(for_anime_id=self.anime_ids[0]).values('rate').annotate(n=Count('rate')).order_by()
+            explain_options = {'analyze': True} if connection.vendor == 'postgresql' else {}
+            self.stdout.write(f'\n{queryset.explain(**explain_options)}')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from anime_catalog.exporter import CONTENT_TYPES, export_anime
+
+
+class Command(BaseCommand):
+    help = 'Streams every anime, with its studio and genre titles, as JSONL or CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='Output file; stdout by default.')
+        parser.add_argument('--format', choices=list(CONTENT_TYPES), default='jsonl')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        lines = export_anime(options['format'], options['chunk_size'])
+        if options['path'] == '-':
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+
+        try:
+            with open(options['path'], 'w', newline='', encoding='utf-8') as file:
+                file.writelines(lines)
+        except OSError as error:
+            raise CommandError(error)
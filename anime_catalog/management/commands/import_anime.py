@@ -0,0 +1,36 @@
+import os
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from anime_catalog.importer import FORMATS, import_anime, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Imports anime from a JSONL or CSV file (genres separated by "|" in CSV), creating missing studios and genres.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or - for stdin.')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--max-errors', type=int, default=20, help='Number of invalid rows to print.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if format not in FORMATS:
+            raise CommandError(f"Cannot infer the format of {path}; pass --format {' or '.join(FORMATS)}.")
+
+        if path == '-':
+            result = import_anime(read_rows(sys.stdin, format), options['batch_size'], options['max_errors'])
+        else:
+            try:
+                with open(path, newline='', encoding='utf-8') as lines:
+                    result = import_anime(read_rows(lines, format), options['batch_size'], options['max_errors'])
+            except OSError as error:
+                raise CommandError(error)
+
+        for error in result['errors']:
+            self.stderr.write(f"Row {error['row']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {result['read']} rows in {result['seconds']}s ({result['rows_per_second']} rows/s): "
+            f"{result['created']} created, {result['skipped']} skipped, {result['invalid']} invalid."
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from anime_catalog.aggregates import rebuild_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the per-anime rating aggregates from the Rating table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--anime', type=int, nargs='*', help='Only rebuild the given anime ids.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_rating_aggregates(options['anime'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating aggregates for {rebuilt} anime.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from anime_catalog.aggregates import rebuild_review_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the per-anime review aggregates from the Review table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--anime', type=int, nargs='*', help='Only rebuild the given anime ids.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_review_aggregates(options['anime'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt review aggregates for {rebuilt} anime.'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from anime_catalog.leaderboard import refresh_leaderboard
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the top-rated leaderboard now instead of waiting for the beat schedule.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-votes', type=int, help='Defaults to LEADERBOARD_MIN_VOTES.')
+
+    def handle(self, *args, **options):
+        result = refresh_leaderboard(min_votes=options['min_votes'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Leaderboard refreshed: {result['created']} created, {result['updated']} updated, "
+            f"{result['deleted']} deleted (mean {result['mean']:.2f})."
+        ))
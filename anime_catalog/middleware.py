@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+from rest_framework.exceptions import PermissionDenied
+from .cache import KEY_PREFIX
+from .models import Profile
+
+
+def _profile_key(user_id):
+    return f'{KEY_PREFIX}:profile:{user_id}'
+
+
+def get_profile(user):
+    # The caller's Profile, shared across requests through the cache; signals.py drops it on changes
+    if not user.is_authenticated:
+        raise PermissionDenied('A profile is required.')
+
+    key = _profile_key(user.pk)
+    profile = cache.get(key)
+    if profile is None:
+        profile = Profile.objects.filter(user_id=user.pk).first()
+        if profile is None:
+            raise PermissionDenied('A profile is required.')
+        cache.set(key, profile, settings.PROFILE_CACHE_TIMEOUT)
+    return profile
+
+
+def forget_profile(user_id):
+    cache.delete(_profile_key(user_id))
+
+
+class ProfileMiddleware:
+    # Exposes request.profile. Resolved lazily, so it sees the user DRF authenticates inside the view.
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.profile = SimpleLazyObject(lambda: get_profile(request.user))
+        return self.get_response(request)
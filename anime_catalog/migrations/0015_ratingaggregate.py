@@ -0,0 +1,49 @@
+# Generated by Django 4.2.6 on 2026-10-18 20:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_rating_aggregates(apps, schema_editor):
+    Anime = apps.get_model('anime_catalog', 'Anime')
+    Rating = apps.get_model('anime_catalog', 'Rating')
+    RatingAggregate = apps.get_model('anime_catalog', 'RatingAggregate')
+
+    aggregates = {anime_id: RatingAggregate(anime_id=anime_id) for anime_id in Anime.objects.values_list('id', flat=True)}
+    for rating in Rating.objects.values('for_anime_id', 'rate'):
+        aggregate = aggregates[rating['for_anime_id']]
+        aggregate.count += 1
+        aggregate.total += rating['rate']
+        field = f"rate_{rating['rate']}"
+        setattr(aggregate, field, getattr(aggregate, field) + 1)
+
+    RatingAggregate.objects.bulk_create(aggregates.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('anime_catalog', '0014_alter_anime_description_alter_anime_title_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingAggregate',
+            fields=[
+                ('anime', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_aggregate', serialize=False, to='anime_catalog.anime')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('rate_1', models.PositiveIntegerField(default=0)),
+                ('rate_2', models.PositiveIntegerField(default=0)),
+                ('rate_3', models.PositiveIntegerField(default=0)),
+                ('rate_4', models.PositiveIntegerField(default=0)),
+                ('rate_5', models.PositiveIntegerField(default=0)),
+                ('rate_6', models.PositiveIntegerField(default=0)),
+                ('rate_7', models.PositiveIntegerField(default=0)),
+                ('rate_8', models.PositiveIntegerField(default=0)),
+                ('rate_9', models.PositiveIntegerField(default=0)),
+                ('rate_10', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(build_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.6 on 2026-10-18 20:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('anime_catalog', '0015_ratingaggregate'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['anime', '-id'], name='comment_anime_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['anime', '-id'], name='review_anime_id_idx'),
+        ),
+    ]
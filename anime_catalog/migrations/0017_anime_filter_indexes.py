@@ -0,0 +1,41 @@
+# Generated by Django 4.2.6 on 2026-10-18 20:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('anime_catalog', '0016_comment_review_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='anime',
+            index=models.Index(fields=['status', '-id'], name='anime_status_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='anime',
+            index=models.Index(fields=['age_rating', '-id'], name='anime_age_rating_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='anime',
+            index=models.Index(fields=['year', '-id'], name='anime_year_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='anime',
+            index=models.Index(fields=['type', '-id'], name='anime_type_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='anime',
+            index=models.Index(fields=['studio', '-id'], name='anime_studio_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='anime',
+            index=models.Index(fields=['type', 'status', '-id'], name='anime_type_status_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='anime',
+            index=models.Index(fields=['year', 'type', '-id'], name='anime_year_type_id_idx'),
+        ),
+    ]
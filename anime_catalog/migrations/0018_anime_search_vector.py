@@ -0,0 +1,61 @@
+# Generated by Django 4.2.6 on 2026-10-18 20:20
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+SEARCH_VECTOR_SQL = """
+    setweight(to_tsvector('english', coalesce({row}.title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce({row}.description, '')), 'B')
+"""
+
+
+def create_search_trigger(apps, schema_editor):
+    # tsvector/GIN are PostgreSQL only; other backends use the in-memory index in search.py
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute(f"""
+        CREATE FUNCTION anime_catalog_anime_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := {SEARCH_VECTOR_SQL.format(row='NEW')};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    schema_editor.execute("""
+        CREATE TRIGGER anime_catalog_anime_search_vector_trigger
+        BEFORE INSERT OR UPDATE OF title, description ON anime_catalog_anime
+        FOR EACH ROW EXECUTE PROCEDURE anime_catalog_anime_search_vector_update()
+    """)
+    schema_editor.execute(
+        f"UPDATE anime_catalog_anime SET search_vector = {SEARCH_VECTOR_SQL.format(row='anime_catalog_anime')}"
+    )
+    schema_editor.execute(
+        'CREATE INDEX anime_search_vector_idx ON anime_catalog_anime USING gin (search_vector)'
+    )
+
+
+def drop_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute('DROP INDEX IF EXISTS anime_search_vector_idx')
+    schema_editor.execute('DROP TRIGGER IF EXISTS anime_catalog_anime_search_vector_trigger ON anime_catalog_anime')
+    schema_editor.execute('DROP FUNCTION IF EXISTS anime_catalog_anime_search_vector_update()')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('anime_catalog', '0017_anime_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='anime',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_trigger, drop_search_trigger),
+    ]
@@ -0,0 +1,39 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+TRIGRAM_INDEXES = (
+    ('anime_title_trgm_idx', 'anime_catalog_anime'),
+    ('studio_title_trgm_idx', 'anime_catalog_studio'),
+    ('genre_title_trgm_idx', 'anime_catalog_genre'),
+)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # gin_trgm_ops serves both ILIKE 'prefix%' and the %> similarity operator used by autocomplete;
+    # other backends use the in-memory prefix trie in search.py
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    for name, table in TRIGRAM_INDEXES:
+        schema_editor.execute(f'CREATE INDEX {name} ON {table} USING gin (title gin_trgm_ops)')
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    for name, table in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('anime_catalog', '0018_anime_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
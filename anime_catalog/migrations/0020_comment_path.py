@@ -0,0 +1,58 @@
+# Generated by Django 4.2.6 on 2026-10-18 20:33
+
+from django.db import migrations, models
+
+
+PATH_ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+PATH_SEGMENT_WIDTH = 7
+
+
+def path_segment(pk):
+    segment = ''
+    while pk:
+        pk, digit = divmod(pk, 36)
+        segment = PATH_ALPHABET[digit] + segment
+    return segment.rjust(PATH_SEGMENT_WIDTH, '0')
+
+
+def backfill_paths(apps, schema_editor):
+    # Level by level from the roots, so every parent's path is final before its replies are computed
+    Comment = apps.get_model('anime_catalog', 'Comment')
+
+    depth = 0
+    level = Comment.objects.filter(parent__isnull=True)
+    while True:
+        batch = [
+            Comment(id=pk, path=(parent_path or '') + path_segment(pk), depth=depth)
+            for pk, parent_path in level.values_list('id', 'parent__path')
+        ]
+        if not batch:
+            break
+        Comment.objects.bulk_update(batch, ['path', 'depth'], batch_size=1000)
+        depth += 1
+        level = Comment.objects.filter(parent__depth=depth - 1).exclude(parent__path='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('anime_catalog', '0019_title_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=252),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['path'], name='comment_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.6 on 2026-10-18 20:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('anime_catalog', '0020_comment_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReplyNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('comment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='anime_catalog.comment')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='anime_catalog.profile')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.6 on 2026-10-18 20:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('anime_catalog', '0021_replynotification'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='rating',
+            name='for_anime',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='anime_catalog.anime'),
+        ),
+        migrations.AlterField(
+            model_name='rating',
+            name='for_user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='anime_catalog.profile'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='rating',
+            unique_together={('for_user', 'for_anime')},
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.6 on 2026-10-18 20:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('anime_catalog', '0022_rating_per_user_and_anime'),
+    ]
+
+    operations = [
+        # Create the composite index before dropping the for_anime one it replaces
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['for_anime', 'rate'], name='rating_anime_rate_idx'),
+        ),
+        migrations.AlterField(
+            model_name='rating',
+            name='for_anime',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='anime_catalog.anime'),
+        ),
+        migrations.AlterField(
+            model_name='rating',
+            name='for_user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='anime_catalog.profile'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.6 on 2026-10-18 20:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('anime_catalog', '0023_rating_anime_rate_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('average', models.FloatField()),
+                ('votes', models.PositiveIntegerField()),
+                ('anime', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entry', to='anime_catalog.anime')),
+                ('studio', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='anime_catalog.studio')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score', '-id'], name='leaderboard_score_idx'), models.Index(fields=['year', '-score', '-id'], name='leaderboard_year_score_idx'), models.Index(fields=['studio', '-score', '-id'], name='leaderboard_studio_score_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 4.2.6 on 2026-10-18 20:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+DIMENSIONS = ('storyline', 'characters', 'artwork', 'sound_series', 'final_grade')
+
+
+def build_review_aggregates(apps, schema_editor):
+    Anime = apps.get_model('anime_catalog', 'Anime')
+    Review = apps.get_model('anime_catalog', 'Review')
+    ReviewAggregate = apps.get_model('anime_catalog', 'ReviewAggregate')
+
+    aggregates = {anime_id: ReviewAggregate(anime_id=anime_id) for anime_id in Anime.objects.values_list('id', flat=True)}
+    for review in Review.objects.values('anime_id', *DIMENSIONS):
+        aggregate = aggregates[review['anime_id']]
+        aggregate.count += 1
+        for dimension in DIMENSIONS:
+            grade = review[dimension]
+            setattr(aggregate, f'{dimension}_total', getattr(aggregate, f'{dimension}_total') + grade)
+            setattr(aggregate, f'{dimension}_{grade}', getattr(aggregate, f'{dimension}_{grade}') + 1)
+
+    ReviewAggregate.objects.bulk_create(aggregates.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('anime_catalog', '0024_leaderboardentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewAggregate',
+            fields=[
+                ('anime', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='review_aggregate', serialize=False, to='anime_catalog.anime')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('storyline_total', models.PositiveIntegerField(default=0)),
+                ('storyline_1', models.PositiveIntegerField(default=0)),
+                ('storyline_2', models.PositiveIntegerField(default=0)),
+                ('storyline_3', models.PositiveIntegerField(default=0)),
+                ('storyline_4', models.PositiveIntegerField(default=0)),
+                ('storyline_5', models.PositiveIntegerField(default=0)),
+                ('characters_total', models.PositiveIntegerField(default=0)),
+                ('characters_1', models.PositiveIntegerField(default=0)),
+                ('characters_2', models.PositiveIntegerField(default=0)),
+                ('characters_3', models.PositiveIntegerField(default=0)),
+                ('characters_4', models.PositiveIntegerField(default=0)),
+                ('characters_5', models.PositiveIntegerField(default=0)),
+                ('artwork_total', models.PositiveIntegerField(default=0)),
+                ('artwork_1', models.PositiveIntegerField(default=0)),
+                ('artwork_2', models.PositiveIntegerField(default=0)),
+                ('artwork_3', models.PositiveIntegerField(default=0)),
+                ('artwork_4', models.PositiveIntegerField(default=0)),
+                ('artwork_5', models.PositiveIntegerField(default=0)),
+                ('sound_series_total', models.PositiveIntegerField(default=0)),
+                ('sound_series_1', models.PositiveIntegerField(default=0)),
+                ('sound_series_2', models.PositiveIntegerField(default=0)),
+                ('sound_series_3', models.PositiveIntegerField(default=0)),
+                ('sound_series_4', models.PositiveIntegerField(default=0)),
+                ('sound_series_5', models.PositiveIntegerField(default=0)),
+                ('final_grade_total', models.PositiveIntegerField(default=0)),
+                ('final_grade_1', models.PositiveIntegerField(default=0)),
+                ('final_grade_2', models.PositiveIntegerField(default=0)),
+                ('final_grade_3', models.PositiveIntegerField(default=0)),
+                ('final_grade_4', models.PositiveIntegerField(default=0)),
+                ('final_grade_5', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(build_review_aggregates, migrations.RunPython.noop),
+    ]
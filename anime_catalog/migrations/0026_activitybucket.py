@@ -0,0 +1,27 @@
+# Generated by Django 4.2.6 on 2026-10-18 20:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('anime_catalog', '0025_reviewaggregate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.PositiveIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('anime', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='anime_catalog.anime')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bucket', 'anime', 'count'], name='activity_bucket_idx')],
+                'unique_together': {('anime', 'bucket')},
+            },
+        ),
+    ]
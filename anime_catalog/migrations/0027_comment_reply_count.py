@@ -0,0 +1,36 @@
+# Generated by Django 4.2.6 on 2026-10-18 21:32
+
+from collections import Counter
+from django.db import migrations, models
+
+
+PATH_SEGMENT_WIDTH = 7
+
+
+def count_replies(apps, schema_editor):
+    # Every comment adds one to each ancestor named in its path (all segments but its own, the last)
+    Comment = apps.get_model('anime_catalog', 'Comment')
+
+    counts = Counter()
+    for path in Comment.objects.exclude(path='').values_list('path', flat=True).iterator(chunk_size=1000):
+        counts.update(int(path[start:start + PATH_SEGMENT_WIDTH], 36) for start in range(0, len(path) - PATH_SEGMENT_WIDTH, PATH_SEGMENT_WIDTH))
+
+    Comment.objects.bulk_update(
+        [Comment(id=pk, reply_count=count) for pk, count in counts.items()], ['reply_count'], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('anime_catalog', '0026_activitybucket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_replies, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator, MinLengthValidator, MaxLengthValidator
 from datetime import datetime
@@ -20,6 +21,20 @@ class Anime(models.Model):
     age_rating = models.CharField(max_length=36)
     studio = models.ForeignKey('Studio', on_delete=models.CASCADE)
     year = models.PositiveSmallIntegerField(validators=[MinValueValidator(1900), MaxValueValidator(current_year)])
+    # Filled by a database trigger on PostgreSQL, see migration 0018
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        # Filters of FullAnimeListAPIView, each paired with the -id ordering of the list
+        indexes = [
+            models.Index(fields=['status', '-id'], name='anime_status_id_idx'),
+            models.Index(fields=['age_rating', '-id'], name='anime_age_rating_id_idx'),
+            models.Index(fields=['year', '-id'], name='anime_year_id_idx'),
+            models.Index(fields=['type', '-id'], name='anime_type_id_idx'),
+            models.Index(fields=['studio', '-id'], name='anime_studio_id_idx'),
+            models.Index(fields=['type', 'status', '-id'], name='anime_type_status_id_idx'),
+            models.Index(fields=['year', 'type', '-id'], name='anime_year_type_id_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -68,13 +83,72 @@ class Profile(models.Model):
 
 
 class Rating(models.Model):
-    for_anime = models.OneToOneField('Anime', on_delete=models.CASCADE)
-    for_user = models.OneToOneField('Profile', on_delete=models.CASCADE)
+    # Both columns lead one of the composite indexes below, so the single-column FK indexes would only slow writes
+    for_anime = models.ForeignKey('Anime', on_delete=models.CASCADE, db_index=False)
+    for_user = models.ForeignKey('Profile', on_delete=models.CASCADE, db_index=False)
     rate = models.PositiveSmallIntegerField(validators=[MinValueValidator(1), MaxValueValidator(10)])
 
+    class Meta:
+        # Conflict target of the bulk upsert
+        unique_together = ('for_user', 'for_anime')
+        indexes = [
+            # Covers the per-anime distribution (GROUP BY rate) as an index-only scan
+            models.Index(fields=['for_anime', 'rate'], name='rating_anime_rate_idx'),
+        ]
+
     def __str__(self):
         return f"{self.for_user.user.first_name} rates {self.for_anime} as {self.rate}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored values so the aggregate signals can apply the delta of an update
+        loaded = dict(zip(field_names, values))
+        if 'for_anime_id' in loaded and 'rate' in loaded:
+            instance._loaded_rating = (loaded['for_anime_id'], loaded['rate'])
+        return instance
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super(Rating, self).save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super(Rating, self).delete(*args, **kwargs)
+
+
+class RatingAggregate(models.Model):
+    anime = models.OneToOneField('Anime', on_delete=models.CASCADE, primary_key=True, related_name='rating_aggregate')
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    rate_1 = models.PositiveIntegerField(default=0)
+    rate_2 = models.PositiveIntegerField(default=0)
+    rate_3 = models.PositiveIntegerField(default=0)
+    rate_4 = models.PositiveIntegerField(default=0)
+    rate_5 = models.PositiveIntegerField(default=0)
+    rate_6 = models.PositiveIntegerField(default=0)
+    rate_7 = models.PositiveIntegerField(default=0)
+    rate_8 = models.PositiveIntegerField(default=0)
+    rate_9 = models.PositiveIntegerField(default=0)
+    rate_10 = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.anime_id}: {self.count} ratings"
+
+    @property
+    def average(self):
+        if not self.count:
+            return None
+        return self.total / self.count
+
+    def distribution(self):
+        distribution = {}
+        for rate in range(1, 11):
+            count = getattr(self, f'rate_{rate}')
+            if count:
+                distribution[rate] = count
+        return distribution
+
 
 class Collection(models.Model):
     name = models.CharField(max_length=128)
@@ -85,16 +159,74 @@ class Collection(models.Model):
         return self.name
 
 
+PATH_ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+PATH_SEGMENT_WIDTH = 7
+COMMENT_PATH_LENGTH = 252
+MAX_COMMENT_DEPTH = COMMENT_PATH_LENGTH // PATH_SEGMENT_WIDTH - 1
+
+
+def path_segment(pk):
+    # Fixed-width base 36, so sorting by path orders siblings by id and a thread depth-first
+    segment = ''
+    while pk:
+        pk, digit = divmod(pk, 36)
+        segment = PATH_ALPHABET[digit] + segment
+    return segment.rjust(PATH_SEGMENT_WIDTH, '0')
+
+
 class Comment(models.Model):
     user = models.ForeignKey('Profile', on_delete=models.CASCADE)
     anime = models.ForeignKey('Anime', on_delete=models.CASCADE)
     text = models.TextField(validators=[MaxLengthValidator(250)])
     created_at = models.DateTimeField(auto_now_add=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
+    # Materialized path: the ids of every ancestor and of the comment itself, see path_segment
+    path = models.CharField(max_length=COMMENT_PATH_LENGTH, default='', editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    # Replies at any depth, kept by save() and the post_delete signal
+    reply_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['anime', '-id'], name='comment_anime_id_idx'),
+            models.Index(fields=['path'], name='comment_path_idx', opclasses=['varchar_pattern_ops']),
+        ]
 
     def __str__(self):
         return f"{self.user.user.username} - {self.anime.title} - {self.created_at}"
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+
+        # The path ends with the comment's own id, known only after the insert
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            parent_path = self.parent.path if self.parent_id else ''
+            self.path = parent_path + path_segment(self.pk)
+            self.depth = self.parent.depth + 1 if self.parent_id else 0
+            Comment.objects.filter(pk=self.pk).update(path=self.path, depth=self.depth)
+            if self.parent_id:
+                Comment.objects.filter(id__in=self.get_ancestor_ids()).update(reply_count=models.F('reply_count') + 1)
+
+    def delete(self, *args, **kwargs):
+        if not self.path:
+            # Not backfilled yet, see the backfill_comment_paths command
+            return super().delete(*args, **kwargs)
+
+        # The whole subtree is collected in one query instead of one cascade query per reply level
+        return Comment.objects.filter(path__startswith=self.path).delete()
+
+    def get_ancestor_ids(self):
+        # Every segment of the path but the last one, the comment's own id
+        return [
+            int(self.path[start:start + PATH_SEGMENT_WIDTH], 36)
+            for start in range(0, len(self.path) - PATH_SEGMENT_WIDTH, PATH_SEGMENT_WIDTH)
+        ]
+
+    def get_descendants(self):
+        return Comment.objects.filter(path__startswith=self.path, depth__gt=self.depth).order_by('path')
+
 
 class Review(models.Model):
     anime = models.ForeignKey('Anime', on_delete=models.CASCADE)
@@ -109,6 +241,124 @@ class Review(models.Model):
 
     class Meta:
         unique_together = ('user', 'anime')
+        indexes = [
+            models.Index(fields=['anime', '-id'], name='review_anime_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.user.username} - {self.anime.title} - {self.final_grade}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored grades so the aggregate signals can apply the delta of an update
+        loaded = dict(zip(field_names, values))
+        if 'anime_id' in loaded and all(dimension in loaded for dimension in REVIEW_DIMENSIONS):
+            instance._loaded_review = (loaded['anime_id'], {dimension: loaded[dimension] for dimension in REVIEW_DIMENSIONS})
+        return instance
+
+
+class ReplyNotification(models.Model):
+    # A reply waiting to go out in its recipient's next digest, see notifications.py
+    recipient = models.ForeignKey('Profile', on_delete=models.CASCADE)
+    comment = models.ForeignKey('Comment', on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+REVIEW_DIMENSIONS = ('storyline', 'characters', 'artwork', 'sound_series', 'final_grade')
+REVIEW_GRADES = range(1, 6)
+
+
+class ReviewAggregate(models.Model):
+    # Per-anime review count plus, for every dimension, the sum of grades and one counter per grade.
+    # Kept current by the Review signals, see aggregates.py
+    anime = models.OneToOneField('Anime', on_delete=models.CASCADE, primary_key=True, related_name='review_aggregate')
+    count = models.PositiveIntegerField(default=0)
+    storyline_total = models.PositiveIntegerField(default=0)
+    storyline_1 = models.PositiveIntegerField(default=0)
+    storyline_2 = models.PositiveIntegerField(default=0)
+    storyline_3 = models.PositiveIntegerField(default=0)
+    storyline_4 = models.PositiveIntegerField(default=0)
+    storyline_5 = models.PositiveIntegerField(default=0)
+    characters_total = models.PositiveIntegerField(default=0)
+    characters_1 = models.PositiveIntegerField(default=0)
+    characters_2 = models.PositiveIntegerField(default=0)
+    characters_3 = models.PositiveIntegerField(default=0)
+    characters_4 = models.PositiveIntegerField(default=0)
+    characters_5 = models.PositiveIntegerField(default=0)
+    artwork_total = models.PositiveIntegerField(default=0)
+    artwork_1 = models.PositiveIntegerField(default=0)
+    artwork_2 = models.PositiveIntegerField(default=0)
+    artwork_3 = models.PositiveIntegerField(default=0)
+    artwork_4 = models.PositiveIntegerField(default=0)
+    artwork_5 = models.PositiveIntegerField(default=0)
+    sound_series_total = models.PositiveIntegerField(default=0)
+    sound_series_1 = models.PositiveIntegerField(default=0)
+    sound_series_2 = models.PositiveIntegerField(default=0)
+    sound_series_3 = models.PositiveIntegerField(default=0)
+    sound_series_4 = models.PositiveIntegerField(default=0)
+    sound_series_5 = models.PositiveIntegerField(default=0)
+    final_grade_total = models.PositiveIntegerField(default=0)
+    final_grade_1 = models.PositiveIntegerField(default=0)
+    final_grade_2 = models.PositiveIntegerField(default=0)
+    final_grade_3 = models.PositiveIntegerField(default=0)
+    final_grade_4 = models.PositiveIntegerField(default=0)
+    final_grade_5 = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.anime_id}: {self.count} reviews"
+
+    def average(self, dimension):
+        if not self.count:
+            return None
+        return getattr(self, f'{dimension}_total') / self.count
+
+    def histogram(self, dimension):
+        return {grade: getattr(self, f'{dimension}_{grade}') for grade in REVIEW_GRADES}
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'dimensions': {
+                dimension: {'average': self.average(dimension), 'histogram': self.histogram(dimension)}
+                for dimension in REVIEW_DIMENSIONS
+            },
+        }
+
+
+class LeaderboardEntry(models.Model):
+    # Precomputed row of the top-rated list, rewritten by leaderboard.refresh_leaderboard. Studio and year
+    # are copied from the anime so the filtered lists are served by the indexes below.
+    anime = models.OneToOneField('Anime', on_delete=models.CASCADE, related_name='leaderboard_entry')
+    studio = models.ForeignKey('Studio', on_delete=models.CASCADE, db_index=False)
+    year = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    average = models.FloatField()
+    votes = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score', '-id'], name='leaderboard_score_idx'),
+            models.Index(fields=['year', '-score', '-id'], name='leaderboard_year_score_idx'),
+            models.Index(fields=['studio', '-score', '-id'], name='leaderboard_studio_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.anime_id}: {self.score:.2f}"
+
+
+class ActivityBucket(models.Model):
+    # Weighted writes (comments, reviews, ratings, collection adds) on an anime during one hour, see activity.py
+    anime = models.ForeignKey('Anime', on_delete=models.CASCADE, db_index=False)
+    bucket = models.PositiveIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('anime', 'bucket')
+        indexes = [
+            # The trending query reads a range of buckets; count is included so it never touches the table
+            models.Index(fields=['bucket', 'anime', 'count'], name='activity_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.anime_id}@{self.bucket}: {self.count}"
@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.urls import reverse
+from .cache import KEY_PREFIX
+from .models import Comment, ReplyNotification
+
+
+FLUSH_SCHEDULED_KEY = f'{KEY_PREFIX}:notifications:flush-scheduled'
+
+
+def buffer_reply(comment_id):
+    from .tasks import flush_reply_notifications_task
+
+    reply = Comment.objects.select_related('parent').only('user_id', 'parent__user_id').filter(id=comment_id).first()
+    # Deleted since, or a reply to your own comment; the author of the parent is notified, not the replier
+    if reply is None or reply.parent is None or reply.parent.user_id == reply.user_id:
+        return
+    ReplyNotification.objects.create(recipient_id=reply.parent.user_id, comment_id=comment_id)
+
+    # One flush per window: replies arriving while one is scheduled are picked up by it
+    window = settings.COMMENT_NOTIFICATION_WINDOW
+    if cache.add(FLUSH_SCHEDULED_KEY, True, window):
+        flush_reply_notifications_task.apply_async(countdown=window)
+
+
+def build_digest(replies):
+    if len(replies) == 1:
+        subject = 'You have received a response to your comment'
+        intro = 'There is a response to your comment:'
+    else:
+        subject = f'You have received {len(replies)} responses to your comments'
+        intro = f'There are {len(replies)} responses to your comments:'
+
+    parts = [intro]
+    for reply in replies:
+        parts.append(
+            f"{reply.user.nickname} on {reply.anime.title}:\n{reply.text}\n"
+            f"{settings.SITE_URL}{reverse('comment-detail', args=[reply.id])}"
+        )
+    parts.append('Thank you for participating in the discussion!')
+
+    return subject, '\n\n'.join(parts)
+
+
+def rebuffer(notifications):
+    # Back in the queue for the next flush, minus replies deleted since
+    comment_ids = set(Comment.objects.filter(id__in=[item.comment_id for item in notifications]).values_list('id', flat=True))
+    ReplyNotification.objects.bulk_create([
+        ReplyNotification(recipient_id=item.recipient_id, comment_id=item.comment_id)
+        for item in notifications if item.comment_id in comment_ids
+    ])
+
+
+def flush_reply_notifications():
+    # One digest per recipient, all sent over a single connection. The rows are claimed and deleted in a
+    # short transaction and the mail goes out after it commits, so a slow SMTP server holds no locks; if
+    # sending fails, the digests not yet sent are buffered again.
+    with transaction.atomic():
+        pending = list(
+            # of=('self',): the joined profiles, users, comments and anime stay unlocked
+            ReplyNotification.objects.select_for_update(skip_locked=True, of=('self',))
+            .select_related('recipient__user', 'comment__user', 'comment__anime')
+            .order_by('id')
+        )
+        if not pending:
+            return 0
+        ReplyNotification.objects.filter(id__in=[notification.id for notification in pending]).delete()
+
+    replies = {}
+    for notification in pending:
+        replies.setdefault(notification.recipient, []).append(notification.comment)
+
+    sent, count = set(), 0
+    try:
+        with get_connection() as connection:
+            for recipient, comments in replies.items():
+                if recipient.user.email:
+                    subject, body = build_digest(comments)
+                    EmailMessage(subject, body, settings.EMAIL_HOST_USER, [recipient.user.email], connection=connection).send()
+                    count += 1
+                sent.add(recipient.pk)
+    except Exception:
+        rebuffer([notification for notification in pending if notification.recipient_id not in sent])
+        raise
+
+    return count
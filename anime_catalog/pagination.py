@@ -0,0 +1,155 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import reduce
+from operator import and_, or_
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    # Seeks past the last row seen instead of using OFFSET and never counts, so every page costs the
+    # same. The queryset ordering is the key; the primary key is appended to make it unique.
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(queryset)
+        position, reverse = self.decode_cursor(request)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [_flip(field) for field in ordering]
+        queryset = queryset.order_by(*ordering)
+
+        try:
+            if position is not None:
+                queryset = queryset.filter(self.get_seek_filter(ordering, position))
+            results = list(queryset[:self.page_size + 1])
+        except (TypeError, ValueError, ValidationError):
+            # A well-formed cursor whose values don't fit the ordering fields
+            raise NotFound(self.invalid_cursor_message)
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = position is not None, has_more
+
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[0]), reverse=True)
+
+    def get_ordering(self, queryset):
+        ordering = [field for field in queryset.query.order_by if isinstance(field, str) and field != '?']
+        if not ordering:
+            ordering = list(queryset.model._meta.ordering) or ['-pk']
+
+        pk_name = queryset.model._meta.pk.name
+        ordering = [_rename(field, 'pk', pk_name) for field in ordering]
+        if pk_name not in [field.lstrip('-') for field in ordering]:
+            # Tie-breaker follows the direction of the leading key
+            ordering.append('-' + pk_name if ordering[0].startswith('-') else pk_name)
+
+        return ordering
+
+    def get_seek_filter(self, ordering, position):
+        # (a, b) after (x, y) <=> a > x OR (a = x AND b > y), with > flipped for descending keys
+        conditions = []
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            equal = [Q(**{other.lstrip('-'): value}) for other, value in zip(ordering[:index], position)]
+            conditions.append(reduce(and_, equal + [Q(**{f'{name}__{lookup}': position[index]})]))
+
+        return reduce(or_, conditions)
+
+    def get_position(self, instance):
+        position = []
+        for field in self.ordering:
+            value = instance
+            for attr in field.lstrip('-').split('__'):
+                value = getattr(value, attr)
+            position.append(value)
+        return position
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'p': position, 'r': int(reverse)}, cls=DjangoJSONEncoder, separators=(',', ':'))
+        cursor = urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+
+        try:
+            payload = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            position, reverse = payload['p'], bool(payload['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        return position, reverse
+
+
+class CatalogPagination(PageNumberPagination):
+    # Page numbers by default; `?pagination=cursor` (or any request carrying a cursor) switches a
+    # list to keyset pagination without a COUNT(*).
+    mode_query_param = 'pagination'
+    keyset_pagination_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+
+        if self.use_keyset(request):
+            self.keyset = self.keyset_pagination_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def use_keyset(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.keyset_pagination_class.cursor_query_param in request.query_params
+        )
+
+
+def _flip(field):
+    return field[1:] if field.startswith('-') else '-' + field
+
+
+def _rename(field, old, new):
+    return field.replace(old, new) if field.lstrip('-') == old else field
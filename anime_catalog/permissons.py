@@ -1,26 +1,58 @@
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache
 from rest_framework import permissions
+from .cache import KEY_PREFIX, get_generations
+
+
+MODERATORS_GROUP = 'Moderators'
+
+
+def get_role_dependencies(user_id):
+    return ['groups', f'user:{user_id}:groups']
+
+
+def is_moderator(user):
+    # Resolved once per request on the user object (or taken from the token claim, see authentication.py)
+    # and shared across requests through the cache; the signals in signals.py invalidate the generations
+    # on membership and group changes
+    if not user.is_authenticated:
+        return False
+
+    # getattr rather than hasattr: TokenUser answers None for any unknown attribute
+    moderator = getattr(user, '_is_moderator', None)
+    if moderator is None:
+        generations = get_generations(get_role_dependencies(user.pk))
+        key = f"{KEY_PREFIX}:moderator:{user.pk}:{'|'.join(generations)}"
+        moderator = cache.get(key)
+        if moderator is None:
+            moderator = Group.objects.filter(name=MODERATORS_GROUP, user__pk=user.pk).exists()
+            cache.set(key, moderator, settings.ROLE_CACHE_TIMEOUT)
+        user._is_moderator = moderator
+
+    return moderator
 
 
 class IsModerator(permissions.BasePermission):
     def has_permission(self, request, view):
-        return request.user.groups.filter(name='Moderators').exists()
+        return is_moderator(request.user)
 
 
 class IsRatingOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        return obj.for_user.user == request.user
+        return obj.for_user_id == request.profile.pk
 
 
 class IsCollectionOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        return obj.user.user == request.user
+        return obj.user_id == request.profile.pk
 
 
 class IsCommentOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        return obj.user.user == request.user
+        return obj.user_id == request.profile.pk
 
 
 class IsReviewOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        return obj.user.user == request.user
+        return obj.user_id == request.profile.pk
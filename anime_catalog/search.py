@@ -0,0 +1,222 @@
+import heapq
+import re
+from bisect import bisect_left, insort
+from collections import defaultdict
+from operator import itemgetter
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import Case, F, FloatField, IntegerField, Lookup, Q, Value, When
+from django.db.models.functions import Length
+from .models import Anime, Genre, Studio
+
+
+TOKEN_RE = re.compile(r'\w+')
+TITLE_WEIGHT = 1.0
+DESCRIPTION_WEIGHT = 0.4
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def build_search_query(text):
+    # Every term must match, each as a prefix: "full met" -> full:* & met:*
+    terms = [f'{term}:*' for term in tokenize(text)]
+    return SearchQuery(' & '.join(terms), search_type='raw', config='english')
+
+
+class InMemorySearchIndex:
+    # Inverted index used where PostgreSQL full-text search is unavailable (SQLite test runs).
+    # Rebuilt lazily after any Anime change.
+    def __init__(self):
+        self._postings = None
+        self._terms = []
+
+    def invalidate(self):
+        self._postings = None
+
+    def build(self):
+        postings = defaultdict(lambda: defaultdict(float))
+        for anime_id, title, description in Anime.objects.values_list('id', 'title', 'description').iterator():
+            for term in tokenize(title):
+                postings[term][anime_id] += TITLE_WEIGHT
+            for term in tokenize(description):
+                postings[term][anime_id] += DESCRIPTION_WEIGHT
+
+        self._terms = sorted(postings)
+        self._postings = postings
+
+    def search(self, text):
+        if self._postings is None:
+            self.build()
+
+        scores = None
+        for query_term in tokenize(text):
+            term_scores = defaultdict(float)
+            index = bisect_left(self._terms, query_term)
+            while index < len(self._terms) and self._terms[index].startswith(query_term):
+                for anime_id, weight in self._postings[self._terms[index]].items():
+                    term_scores[anime_id] += weight
+                index += 1
+
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {anime_id: score + term_scores[anime_id] for anime_id, score in scores.items() if anime_id in term_scores}
+
+        return scores or {}
+
+
+search_index = InMemorySearchIndex()
+
+
+def search_anime(text, queryset=None):
+    queryset = Anime.objects.all() if queryset is None else queryset
+
+    if connection.vendor == 'postgresql':
+        query = build_search_query(text)
+        return queryset.filter(search_vector=query).annotate(rank=SearchRank(F('search_vector'), query)).order_by('-rank', '-id')
+
+    scores = search_index.search(text)
+    if not scores:
+        return queryset.none()
+
+    rank = Case(*[When(id=anime_id, then=Value(score)) for anime_id, score in scores.items()], output_field=FloatField())
+    return queryset.filter(id__in=scores).annotate(rank=rank).order_by('-rank', '-id')
+
+
+AUTOCOMPLETE_MODELS = {
+    'anime': Anime,
+    'studios': Studio,
+    'genres': Genre,
+}
+AUTOCOMPLETE_MAX_LIMIT = 20
+
+
+class TitlePrefix(Lookup):
+    # title ILIKE 'prefix%'. istartswith compiles to UPPER(title) LIKE UPPER(...), which the gin_trgm_ops
+    # index on the bare column (migration 0019) cannot serve; ILIKE can. PostgreSQL only.
+    lookup_name = 'ilike_prefix'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        rhs_params = [connection.ops.prep_for_like_query(param) + '%' for param in rhs_params]
+        return f'{lhs} ILIKE {rhs}', lhs_params + rhs_params
+
+
+for _model in AUTOCOMPLETE_MODELS.values():
+    _model._meta.get_field('title').register_lookup(TitlePrefix)
+
+
+class _TrieNode:
+    __slots__ = ('children', 'top', 'bucket', 'bucket_keys')
+
+    def __init__(self):
+        self.children = {}
+        self.top = []
+        self.bucket = None
+        self.bucket_keys = None
+
+
+class PrefixTrie:
+    # Titles are inserted from the start of every word, so "alch" finds "Fullmetal Alchemist". Every
+    # node keeps its best `size` entries, making a lookup O(len(prefix)). Paths stop at `max_depth`
+    # characters; those nodes keep all their entries, sorted by key on first use, for longer prefixes.
+    def __init__(self, size=AUTOCOMPLETE_MAX_LIMIT, max_depth=12):
+        self.size = size
+        self.max_depth = max_depth
+        self.root = _TrieNode()
+
+    def insert(self, pk, title):
+        key = ' '.join(tokenize(title))
+        starts = [match.start() for match in TOKEN_RE.finditer(key)]
+
+        for position, start in enumerate(starts):
+            # Title-start matches first, then shorter titles
+            entry = (position > 0, len(title), key, pk, title, key[start:])
+            node = self.root
+            for depth, char in enumerate(key[start:start + self.max_depth], 1):
+                node = node.children.setdefault(char, _TrieNode())
+                # Earlier words rank first, so a title already here keeps its slot; a repeated word
+                # must not take a second one
+                if (len(node.top) < self.size or entry < node.top[-1]) and all(other[3] != pk for other in node.top):
+                    insort(node.top, entry)
+                    del node.top[self.size:]
+                if depth == self.max_depth:
+                    if node.bucket is None:
+                        node.bucket = []
+                    node.bucket.append(entry)
+                    node.bucket_keys = None
+
+    def search(self, prefix, limit):
+        prefix = ' '.join(tokenize(prefix))
+        node = self.root
+        for char in prefix[:self.max_depth]:
+            node = node.children.get(char)
+            if node is None:
+                return []
+
+        if len(prefix) > self.max_depth:
+            if node.bucket_keys is None:
+                node.bucket.sort(key=itemgetter(5))
+                node.bucket_keys = [entry[5] for entry in node.bucket]
+            start = bisect_left(node.bucket_keys, prefix)
+            stop = bisect_left(node.bucket_keys, prefix + '\uffff', start)
+            # Best entry per title before taking the top ones, so repeats can't crowd others out
+            best = {}
+            for entry in node.bucket[start:stop]:
+                if entry[3] not in best or entry < best[entry[3]]:
+                    best[entry[3]] = entry
+            candidates = heapq.nsmallest(limit, best.values())
+        else:
+            candidates = node.top[:limit]
+
+        return [{'id': entry[3], 'title': entry[4]} for entry in candidates]
+
+
+class AutocompleteIndex:
+    # One trie per model, built on first use and dropped by the model signals
+    def __init__(self):
+        self._tries = {}
+
+    def invalidate(self, kind=None):
+        if kind is None:
+            self._tries = {}
+        else:
+            self._tries.pop(kind, None)
+
+    def search(self, kind, prefix, limit):
+        trie = self._tries.get(kind)
+        if trie is None:
+            trie = PrefixTrie()
+            for pk, title in AUTOCOMPLETE_MODELS[kind].objects.values_list('pk', 'title').iterator():
+                trie.insert(pk, title)
+            self._tries[kind] = trie
+
+        return trie.search(prefix, limit)
+
+
+autocomplete_index = AutocompleteIndex()
+
+
+def autocomplete_queryset(kind, text):
+    # Prefix matches first, then by trigram similarity; ILIKE and %> are both served by the
+    # gin_trgm_ops index on title (see migration 0019)
+    return AUTOCOMPLETE_MODELS[kind].objects.filter(
+        Q(title__ilike_prefix=text) | Q(title__trigram_word_similar=text)
+    ).annotate(
+        is_prefix=Case(When(title__ilike_prefix=text, then=Value(1)), default=Value(0), output_field=IntegerField()),
+        similarity=TrigramWordSimilarity(text, 'title'),
+    ).order_by('-is_prefix', '-similarity', Length('title'), 'title')
+
+
+def autocomplete(text, kinds=None, limit=10):
+    text = ' '.join(tokenize(text))
+    kinds = kinds or list(AUTOCOMPLETE_MODELS)
+    limit = min(limit, AUTOCOMPLETE_MAX_LIMIT)
+
+    if connection.vendor != 'postgresql':
+        return {kind: autocomplete_index.search(kind, text, limit) for kind in kinds}
+
+    return {kind: list(autocomplete_queryset(kind, text).values('id', 'title')[:limit]) for kind in kinds}
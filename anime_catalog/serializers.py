@@ -1,9 +1,99 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
-from .models import Anime, Genre, Studio, Profile, Rating, Collection, Comment, Review
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from .aggregates import upsert_review
+from .authentication import CatalogRefreshToken
+from .models import Anime, Genre, Studio, Profile, Rating, Collection, Comment, Review, MAX_COMMENT_DEPTH, \
+    LeaderboardEntry, current_year
 from django.contrib.auth.models import User
 
 
-class ShortAnimeSerializer(serializers.ModelSerializer):
+class EagerLoadingMixin:
+    # Derives select_related/prefetch_related paths from the declared fields. Relations the
+    # fields cannot reveal (e.g. inside a SerializerMethodField) go to the *_related_fields hooks.
+    select_related_fields = ()
+    prefetch_related_fields = ()
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        if '_eager_loading' not in cls.__dict__:
+            cls._eager_loading = cls.get_eager_loading()
+        select_related, prefetch_related = cls._eager_loading
+
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+    @classmethod
+    def get_eager_loading(cls):
+        select_related = set(cls.select_related_fields)
+        prefetch_related = set(cls.prefetch_related_fields)
+        _collect_eager_loading(cls(), cls.Meta.model, [], False, select_related, prefetch_related)
+
+        # A path that is already joined is implied by any longer joined path.
+        select_related = {
+            path for path in select_related
+            if not any(other.startswith(path + '__') for other in select_related)
+        }
+        return sorted(select_related), sorted(prefetch_related)
+
+
+def _relation_path(model, attrs):
+    path, many = [], False
+
+    for attr in attrs:
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            break
+        if not field.is_relation:
+            break
+        path.append(attr)
+        many = many or field.many_to_many or field.one_to_many
+        model = field.related_model
+
+    return path, many, model
+
+
+def _collect_eager_loading(serializer, model, prefix, through_many, select_related, prefetch_related):
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+
+        if isinstance(field, serializers.ListSerializer):
+            attrs, nested = field.source_attrs, field.child
+        elif isinstance(field, serializers.BaseSerializer):
+            attrs, nested = field.source_attrs, field
+        elif isinstance(field, serializers.ManyRelatedField):
+            attrs, nested = field.source_attrs, None
+        elif isinstance(field, serializers.RelatedField):
+            if isinstance(field, serializers.PrimaryKeyRelatedField) and len(field.source_attrs) == 1:
+                # Served from the local `<name>_id` column, no join needed.
+                continue
+            attrs, nested = field.source_attrs, None
+        else:
+            attrs, nested = field.source_attrs[:-1], None
+
+        path, many, related_model = _relation_path(model, attrs)
+        if not path:
+            continue
+
+        full_path = '__'.join(prefix + path)
+        if through_many or many:
+            prefetch_related.add(full_path)
+        else:
+            select_related.add(full_path)
+
+        if nested is not None:
+            _collect_eager_loading(
+                nested, related_model, prefix + path, through_many or many, select_related, prefetch_related
+            )
+
+
+class ShortAnimeSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     studio = serializers.SlugRelatedField(many=False, queryset=Studio.objects.all(), slug_field='title')
 
     class Meta:
@@ -11,22 +101,62 @@ class ShortAnimeSerializer(serializers.ModelSerializer):
         fields = ('title', 'image', 'studio', 'year')
 
 
-class FullAnimeSerializer(serializers.ModelSerializer):
+class AnimeSearchSerializer(ShortAnimeSerializer):
+    rank = serializers.FloatField(read_only=True)
+
+    class Meta(ShortAnimeSerializer.Meta):
+        fields = ('id', 'title', 'image', 'studio', 'year', 'rank')
+
+
+class TrendingAnimeSerializer(ShortAnimeSerializer):
+    score = serializers.FloatField(read_only=True)
+
+    class Meta(ShortAnimeSerializer.Meta):
+        fields = ('id', 'title', 'image', 'studio', 'year', 'score')
+
+
+class FullAnimeSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     studio = serializers.SlugRelatedField(many=False, queryset=Studio.objects.all(), slug_field='title')
     genres = serializers.SlugRelatedField(many=True, queryset=Genre.objects.all(), slug_field='title')
 
     class Meta:
         model = Anime
-        fields = '__all__'
+        exclude = ('search_vector',)
+
 
+class LeaderboardEntrySerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    id = serializers.IntegerField(source='anime_id', read_only=True)
+    title = serializers.CharField(source='anime.title', read_only=True)
+    image = serializers.ImageField(source='anime.image', read_only=True)
+    studio = serializers.SlugRelatedField(slug_field='title', read_only=True)
 
-class GenreSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = LeaderboardEntry
+        fields = ('id', 'title', 'image', 'studio', 'year', 'score', 'average', 'votes')
+
+
+class AnimeImportSerializer(serializers.Serializer):
+    # Field checks only: relations and title uniqueness are resolved per chunk by importer.py
+    title = serializers.CharField(max_length=516)
+    description = serializers.CharField(min_length=100, max_length=5000)
+    type = serializers.CharField(max_length=64)
+    episodes = serializers.IntegerField(min_value=0, max_value=32767)
+    ready_episodes = serializers.IntegerField(min_value=0, max_value=32767)
+    length_of_episodes = serializers.IntegerField(min_value=0, max_value=32767)
+    status = serializers.CharField(max_length=64)
+    age_rating = serializers.CharField(max_length=36)
+    studio = serializers.CharField(max_length=255)
+    genres = serializers.ListField(child=serializers.CharField(max_length=128), required=False, default=list)
+    year = serializers.IntegerField(min_value=1900, max_value=current_year)
+
+
+class GenreSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
         model = Genre
         fields = '__all__'
 
 
-class StudioSerializer(serializers.ModelSerializer):
+class StudioSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
         model = Studio
         fields = '__all__'
@@ -70,20 +200,46 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         return user
 
 
-class RatingSerializer(serializers.ModelSerializer):
+class RatingSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     for_anime = serializers.SlugRelatedField(queryset=Anime.objects.all(), slug_field='title')
 
     class Meta:
         model = Rating
         fields = ('for_anime', 'rate')
 
+    def validate_for_anime(self, anime):
+        # One rating per user and anime (Rating.unique_together); the bulk and PUT endpoints upsert instead
+        profile_id = self.instance.for_user_id if self.instance else self.context['request'].profile.pk
+        ratings = Rating.objects.filter(for_user_id=profile_id, for_anime=anime)
+        if self.instance:
+            ratings = ratings.exclude(pk=self.instance.pk)
+        if ratings.exists():
+            raise serializers.ValidationError('You have already rated this anime.')
+        return anime
+
     def create(self, validated_data):
-        user = Profile.objects.get(user=self.context['request'].user)
-        rating = Rating.objects.create(for_user=user, **validated_data)
-        return rating
+        user = self.context['request'].profile
+        try:
+            with transaction.atomic():
+                return Rating.objects.create(for_user=user, **validated_data)
+        except IntegrityError:
+            # Rated by a concurrent request since the check above
+            raise serializers.ValidationError({'for_anime': ['You have already rated this anime.']})
+
+
+class RatingRateSerializer(serializers.Serializer):
+    rate = serializers.IntegerField(min_value=1, max_value=10)
+
+
+class RatingItemSerializer(RatingRateSerializer):
+    for_anime = serializers.CharField(max_length=516)
+
+
+class RatingBatchSerializer(serializers.Serializer):
+    ratings = RatingItemSerializer(many=True, allow_empty=False, max_length=1000)
 
 
-class CollectionSerializer(serializers.ModelSerializer):
+class CollectionSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     items = serializers.SlugRelatedField(
         many=True,
         slug_field='title',
@@ -95,7 +251,7 @@ class CollectionSerializer(serializers.ModelSerializer):
         fields = ('name', 'items')
 
     def create(self, validated_data):
-        user = Profile.objects.get(user=self.context['request'].user)
+        user = self.context['request'].profile
         items_data = validated_data.pop('items', [])
         collection = Collection.objects.create(user=user, **validated_data)
 
@@ -106,7 +262,7 @@ class CollectionSerializer(serializers.ModelSerializer):
         return collection
 
 
-class CommentReadOnlySerializer(serializers.ModelSerializer):
+class CommentReadOnlySerializer(EagerLoadingMixin, serializers.ModelSerializer):
     anime_reply = serializers.CharField(source='parent.anime.title', read_only=True)
     created_at = serializers.DateTimeField(format="%d %B %Y %H:%M:%S")
     user = serializers.CharField(source='user.nickname', read_only=True)
@@ -120,14 +276,35 @@ class CommentReadOnlySerializer(serializers.ModelSerializer):
         fields = ('anime_reply', 'created_at', 'anime', 'text', 'parent', 'user', 'id', 'reply_to')
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentNodeSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    created_at = serializers.DateTimeField(format="%d %B %Y %H:%M:%S")
+    user = serializers.CharField(source='user.nickname', read_only=True)
+
+    class Meta:
+        model = Comment
+        fields = ('id', 'parent', 'user', 'text', 'created_at', 'reply_count')
+
+
+class CommentSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
         model = Comment
         fields = ('text', 'anime', 'parent')
 
+    def validate_parent(self, parent):
+        if parent is not None and parent.depth >= MAX_COMMENT_DEPTH:
+            raise serializers.ValidationError('This thread is too deep to reply to.')
+        return parent
+
+    def update(self, instance, validated_data):
+        # A comment stays where it was posted: its path, its replies' paths and its ancestors' reply counts
+        # all follow from the anime and parent it was created with
+        validated_data.pop('anime', None)
+        validated_data.pop('parent', None)
+        return super().update(instance, validated_data)
+
     def create(self, validated_data):
         comment_data = {
-            'user': Profile.objects.get(user=self.context['request'].user),
+            'user': self.context['request'].profile,
             'anime': validated_data.get('anime'),
             'text': validated_data.get('text'),
             'parent': validated_data.get('parent')
@@ -136,7 +313,7 @@ class CommentSerializer(serializers.ModelSerializer):
         return comment
 
 
-class ReviewReadOnlySerializer(serializers.ModelSerializer):
+class ReviewReadOnlySerializer(EagerLoadingMixin, serializers.ModelSerializer):
     user = serializers.CharField(source='user.nickname', read_only=True)
     anime = serializers.SlugRelatedField(
         many=False, slug_field='title', read_only=True
@@ -148,7 +325,7 @@ class ReviewReadOnlySerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     anime = serializers.SlugRelatedField(queryset=Anime.objects.all(), slug_field='title')
     user = serializers.CharField(source='user.nickname', read_only=True)
 
@@ -157,6 +334,25 @@ class ReviewSerializer(serializers.ModelSerializer):
         fields = ('anime', 'storyline', 'characters', 'artwork', 'sound_series', 'final_grade', 'text', 'user')
 
     def create(self, validated_data):
-        user = Profile.objects.get(user=self.context['request'].user)
+        user = self.context['request'].profile
         review = Review.objects.create(user=user, **validated_data)
         return review
+
+
+class ReviewUpsertSerializer(ReviewSerializer):
+    # The anime comes from the URL
+    anime = serializers.SlugRelatedField(slug_field='title', read_only=True)
+
+    def upsert(self, anime, user):
+        # The original date is kept
+        review = Review(anime=anime, user=user, **self.validated_data)
+        self.instance = upsert_review(review, list(self.validated_data))
+        return self.instance
+
+
+class CatalogTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = CatalogRefreshToken
+
+
+class CatalogTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = CatalogRefreshToken
@@ -1,19 +1,187 @@
-from django.db.models.signals import post_save
+from django.contrib.auth.models import Group, User
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
-from django.urls import reverse
-from anime_catalog.models import Comment
-from .tasks import send_comment_notification_task
+from anime_catalog.models import Anime, Genre, Studio, Profile, Collection, Comment, Rating, RatingAggregate, Review, \
+    ReviewAggregate
+from .activity import record_activity
+from .aggregates import record_rating, discard_rating, replace_rating, record_review, discard_review, replace_review, \
+    review_grades
+from .authentication import forget_account, revoke_claims
+from .cache import invalidate
+from .filters import anime_ids, genre_ids, studio_ids
+from .middleware import forget_profile
+from .search import autocomplete_index, search_index
+from .tasks import buffer_reply_notification_task
+
+
+@receiver(post_save, sender=Comment)
+def record_comment_activity(sender, instance, created, **kwargs):
+    if created:
+        record_activity('comment', [instance.anime_id])
+
+
+@receiver(post_save, sender=Review)
+def record_review_activity(sender, instance, created, **kwargs):
+    if created:
+        record_activity('review', [instance.anime_id])
+
+
+@receiver(m2m_changed, sender=Collection.items.through)
+def record_collection_activity(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add' and pk_set:
+        record_activity('collection', [instance.pk] if reverse else pk_set)
+
+
+@receiver(post_delete, sender=Comment)
+def discount_deleted_reply(sender, instance, **kwargs):
+    # Once per deleted comment, whether removed with its thread or by a cascade; ancestors deleted in
+    # the same pass are already gone and match nothing
+    if instance.parent_id and instance.path:
+        Comment.objects.filter(id__in=instance.get_ancestor_ids()).update(reply_count=F('reply_count') - 1)
 
 
 @receiver(post_save, sender=Comment)
 def send_comment_reply_notification(sender, instance, created, **kwargs):
-    if created and instance.parent:
-        subject = 'You have received a response to your comment'
-        message = f"There is a response to your comment:\n\n{instance.text}\n\n" \
-                  f"To view the response, click on the following link:\n" \
-                  f"http://127.0.0.1:8000{reverse('comment-detail', args=[instance.id])}\n\n" \
-                  "Thank you for participating in the discussion!"
+    # Nothing is queued for replies whose transaction rolls back, and the request does no notification work
+    if created and instance.parent_id:
+        comment_id = instance.id
+        transaction.on_commit(lambda: buffer_reply_notification_task.delay(comment_id))
+
+
+@receiver(post_save, sender=Anime)
+def create_aggregates(sender, instance, created, **kwargs):
+    if created:
+        RatingAggregate.objects.get_or_create(anime=instance)
+        ReviewAggregate.objects.get_or_create(anime=instance)
+
+
+@receiver(post_save, sender=Rating)
+def update_rating_aggregate_on_save(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_loaded_rating', None)
+
+    if created or previous is None:
+        record_rating(instance.for_anime_id, instance.rate)
+    else:
+        replace_rating(*previous, instance.for_anime_id, instance.rate)
+    if previous != (instance.for_anime_id, instance.rate):
+        record_activity('rating', [instance.for_anime_id])
+
+    instance._loaded_rating = (instance.for_anime_id, instance.rate)
+
+
+@receiver(post_delete, sender=Rating)
+def update_rating_aggregate_on_delete(sender, instance, **kwargs):
+    previous = getattr(instance, '_loaded_rating', (instance.for_anime_id, instance.rate))
+    discard_rating(*previous)
+
+
+@receiver(post_save, sender=Review)
+def update_review_aggregate_on_save(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_loaded_review', None)
+    grades = review_grades(instance)
+
+    if created or previous is None:
+        record_review(instance.anime_id, grades)
+    else:
+        replace_review(*previous, instance.anime_id, grades)
+
+    instance._loaded_review = (instance.anime_id, grades)
+
+
+@receiver(post_delete, sender=Review)
+def update_review_aggregate_on_delete(sender, instance, **kwargs):
+    previous = getattr(instance, '_loaded_review', (instance.anime_id, review_grades(instance)))
+    discard_review(*previous)
+
+
+@receiver([post_save, post_delete], sender=Anime)
+def invalidate_anime_cache(sender, instance, **kwargs):
+    invalidate('anime', f'anime:{instance.pk}')
+    anime_ids.clear()
+    search_index.invalidate()
+    autocomplete_index.invalidate('anime')
+
+
+@receiver(m2m_changed, sender=Anime.genres.through)
+def invalidate_anime_genres_cache(sender, instance, action, reverse, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if reverse:
+        # genre.anime_set changes: every anime view depends on 'genre'
+        invalidate('anime', 'genre')
+    else:
+        invalidate('anime', f'anime:{instance.pk}')
+
+
+@receiver([post_save, post_delete], sender=Genre)
+def invalidate_genre_cache(sender, instance, **kwargs):
+    invalidate('genre')
+    genre_ids.clear()
+    autocomplete_index.invalidate('genres')
+
+
+@receiver([post_save, post_delete], sender=Studio)
+def invalidate_studio_cache(sender, instance, **kwargs):
+    invalidate('studio')
+    studio_ids.clear()
+    autocomplete_index.invalidate('studios')
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_user_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # group.user_set.clear() does not report the users
+        instance._cleared_user_ids = list(instance.user_set.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        user_ids = [instance.pk]
+    elif action == 'post_clear':
+        user_ids = instance._cleared_user_ids
+    else:
+        user_ids = pk_set
+
+    if user_ids:
+        invalidate(*[f'user:{user_id}:groups' for user_id in user_ids])
+        revoke_claims(*user_ids)
+
+
+@receiver(pre_delete, sender=Group)
+def remember_group_members(sender, instance, **kwargs):
+    instance._member_ids = list(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Group)
+def invalidate_group_roles(sender, instance, **kwargs):
+    invalidate('groups')
+
+    member_ids = getattr(instance, '_member_ids', None)
+    if member_ids is None:
+        member_ids = list(instance.user_set.values_list('pk', flat=True))
+    if member_ids:
+        revoke_claims(*member_ids)
+
+
+@receiver(post_save, sender=User)
+def refresh_user_account(sender, instance, created, update_fields, **kwargs):
+    if created or update_fields == frozenset(['last_login']):
+        return
+
+    # Deactivation, staff changes and password changes
+    forget_account(instance.pk)
+    revoke_claims(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def forget_deleted_user(sender, instance, **kwargs):
+    forget_account(instance.pk)
 
-        recipient_email = instance.user.user.email
 
-        send_comment_notification_task.delay(subject, message, recipient_email)
+@receiver([post_save, post_delete], sender=Profile)
+def forget_cached_profile(sender, instance, **kwargs):
+    forget_profile(instance.user_id)
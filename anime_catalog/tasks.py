@@ -1,9 +1,24 @@
 from aniverse.celery import app
-from django.core.mail import send_mail
-from django.conf import settings
+from .activity import prune_activity
+from .leaderboard import refresh_leaderboard
+from .notifications import buffer_reply, flush_reply_notifications
 
 
 @app.task
-def send_comment_notification_task(subject, message, recipient_email):
-    send_mail(subject, message, settings.EMAIL_HOST_USER, [recipient_email])
+def buffer_reply_notification_task(comment_id):
+    buffer_reply(comment_id)
 
+
+@app.task
+def flush_reply_notifications_task():
+    return flush_reply_notifications()
+
+
+@app.task
+def refresh_leaderboard_task():
+    return refresh_leaderboard()
+
+
+@app.task
+def prune_activity_task():
+    return prune_activity()
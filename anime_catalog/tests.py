@@ -1,9 +1,38 @@
+import json
+import os
+from smtplib import SMTPException
+import tempfile
+from importlib import import_module
+from base64 import urlsafe_b64encode
+from io import StringIO
 from django.utils import timezone
 from rest_framework.test import APITestCase
 from rest_framework import status
 from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
-from .models import Anime, Genre, Studio, Profile, Rating, Collection, Comment, Review
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from unittest import skipUnless
+from .models import Anime, Genre, Studio, Profile, Rating, RatingAggregate, Collection, Comment, Review, \
+    ReplyNotification, LeaderboardEntry, ReviewAggregate, ActivityBucket, MAX_COMMENT_DEPTH, path_segment
+from .activity import current_bucket, prune_activity
+from .authentication import CatalogRefreshToken
+from .leaderboard import refresh_leaderboard
+from .exporter import iter_anime
+from .importer import insert_anime
+from .notifications import FLUSH_SCHEDULED_KEY, buffer_reply, flush_reply_notifications
+from .search import PrefixTrie, autocomplete_queryset
+from .serializers import AnimeImportSerializer
+from .threads import MAX_THREAD_DEPTH, fetch_descendants
+from .tasks import flush_reply_notifications_task
+from django.apps import apps
+from django.conf import settings
 from django.contrib.auth.models import User, Group
+from aniverse.celery import app as celery_app
 
 
 class ShortAnimeListAPITest(APITestCase):
@@ -753,6 +782,16 @@ class RatingCreateAPIViewTest(APITestCase):
         # Check if a new rating has been created in the database
         self.assertTrue(Rating.objects.filter(for_anime=self.anime, for_user=self.profile).exists())
 
+    def test_second_rating_of_the_same_anime(self):
+        headers = {'Authorization': f'Bearer {self.access_token}'}
+        self.client.post(self.url, {'for_anime': self.anime.title, 'rate': 8}, format='json', headers=headers)
+
+        response = self.client.post(self.url, {'for_anime': self.anime.title, 'rate': 3}, format='json', headers=headers)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('for_anime', response.data)
+        self.assertEqual(Rating.objects.get(for_user=self.profile).rate, 8)
+
 
 class RatingUpdateAPIViewTest(APITestCase):
     def setUp(self):
@@ -812,6 +851,28 @@ class RatingUpdateAPIViewTest(APITestCase):
         # Check if the rating has been updated with the new rate
         self.assertEqual(self.rating.rate, updated_rate)
 
+    def test_move_to_an_anime_already_rated(self):
+        other = Anime.objects.create(
+            title='Other Anime',
+            description='Test description',
+            type='TV',
+            episodes=12,
+            ready_episodes=12,
+            length_of_episodes=24,
+            status='Ongoing',
+            age_rating='PG-13',
+            studio=self.anime.studio,
+            year=2022,
+        )
+        Rating.objects.create(for_anime=other, for_user=self.profile, rate=4)
+        headers = {'Authorization': f'Bearer {self.access_token}'}
+
+        response = self.client.put(self.url, {'for_anime': other.title, 'rate': 9}, format='json', headers=headers)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.rating.refresh_from_db()
+        self.assertEqual((self.rating.for_anime, self.rating.rate), (self.anime, 7))
+
 
 class RatingDeleteAPIViewTest(APITestCase):
     def setUp(self):
@@ -1665,3 +1726,1803 @@ class ReviewDeleteAPIViewTest(APITestCase):
         # Your assertion checks here
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
         self.review.refresh_from_db()
+
+
+class EagerLoadingQueryCountTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+        # Create enough rows that a per-row lazy load would show up in the query count
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.profile = Profile.objects.create(
+            user=self.user,
+            nickname='TestUser',
+            birth_date='1990-06-06',
+            sex='male',
+            bio='',
+        )
+        genres = [Genre.objects.create(title=f'Genre {i}') for i in range(3)]
+
+        for i in range(5):
+            studio = Studio.objects.create(title=f'Studio {i}')
+            anime = Anime.objects.create(
+                title=f'Anime {i}',
+                description='Test description',
+                type='TV',
+                episodes=12,
+                ready_episodes=12,
+                length_of_episodes=24,
+                status='Ongoing',
+                age_rating='PG-13',
+                studio=studio,
+                year=2022,
+            )
+            anime.genres.set(genres)
+            parent = Comment.objects.create(user=self.profile, anime=anime, text=f'Comment {i}')
+            Comment.objects.create(user=self.profile, anime=anime, text=f'Reply {i}', parent=parent)
+
+        self.anime = anime
+
+    def test_full_anime_list_query_count(self):
+        # Count, anime joined with studio, genres prefetch
+        with self.assertNumQueries(3):
+            response = self.client.get('/catalog_api/full-anime/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual(len(response.data['results'][0]['genres']), 3)
+
+    def test_short_anime_list_query_count(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/catalog_api/short-anime/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_anime_retrieve_query_count(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/catalog_api/anime-retrieve/{self.anime.pk}/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['studio'], 'Studio 4')
+
+    def test_comment_list_query_count(self):
+        # Replies walk parent.anime and parent.user, which must be joined up front
+        with self.assertNumQueries(2):
+            response = self.client.get('/catalog_api/comment-list/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['reply_to'], 'TestUser')
+
+
+class RatingAggregateTest(APITestCase):
+    def setUp(self):
+        # Create a user with a profile and two anime to move a rating between
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        studio = Studio.objects.create(title='Studio 1')
+        self.profile = Profile.objects.create(
+            user=self.user,
+            nickname='TestUser',
+            birth_date='1990-06-06',
+            sex='male',
+            bio='',
+        )
+        self.anime = Anime.objects.create(
+            title='Test Anime',
+            description='Test description',
+            type='TV',
+            episodes=12,
+            ready_episodes=12,
+            length_of_episodes=24,
+            status='Ongoing',
+            age_rating='PG-13',
+            studio=studio,
+            year=2022,
+        )
+        self.other_anime = Anime.objects.create(
+            title='Other Anime',
+            description='Test description',
+            type='TV',
+            episodes=12,
+            ready_episodes=12,
+            length_of_episodes=24,
+            status='Ongoing',
+            age_rating='PG-13',
+            studio=studio,
+            year=2022,
+        )
+
+        refresh = RefreshToken.for_user(self.user)
+        self.headers = {'Authorization': f'Bearer {refresh.access_token}'}
+
+    def test_aggregate_follows_create_update_delete(self):
+        response = self.client.post(
+            '/catalog_api/rating-create/', {'for_anime': self.anime.title, 'rate': 8}, format='json', headers=self.headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        aggregate = RatingAggregate.objects.get(pk=self.anime.pk)
+        self.assertEqual((aggregate.count, aggregate.total, aggregate.rate_8), (1, 8, 1))
+
+        # Re-rating and moving the rating to another anime must move the counts as well
+        rating = Rating.objects.get(for_user=self.profile)
+        response = self.client.put(
+            f'/catalog_api/rating-update/{rating.pk}/', {'for_anime': self.other_anime.title, 'rate': 3},
+            format='json', headers=self.headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(RatingAggregate.objects.get(pk=self.anime.pk).count, 0)
+        aggregate = RatingAggregate.objects.get(pk=self.other_anime.pk)
+        self.assertEqual((aggregate.count, aggregate.total, aggregate.rate_3), (1, 3, 1))
+
+        response = self.client.delete(f'/catalog_api/rating-delete/{rating.pk}/', headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        aggregate = RatingAggregate.objects.get(pk=self.other_anime.pk)
+        self.assertEqual((aggregate.count, aggregate.total, aggregate.rate_3), (0, 0, 0))
+
+    def test_rating_endpoints_use_single_lookup(self):
+        Rating.objects.create(for_anime=self.anime, for_user=self.profile, rate=6)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/catalog_api/anime-retrieve/{self.anime.pk}/average-rating/')
+        self.assertEqual(response.data['average_rating'], '6.00')
+
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/catalog_api/anime-retrieve/{self.anime.pk}/rating-count/')
+        self.assertEqual(response.data, {6: 1})
+
+    def test_unknown_anime_returns_not_found(self):
+        response = self.client.get('/catalog_api/anime-retrieve/999/average-rating/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_anime_without_aggregate_row(self):
+        RatingAggregate.objects.filter(pk=self.anime.pk).delete()
+
+        response = self.client.get(f'/catalog_api/anime-retrieve/{self.anime.pk}/rating-count/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {})
+
+        response = self.client.get('/catalog_api/anime-retrieve/999/rating-count/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_rebuild_command(self):
+        Rating.objects.create(for_anime=self.anime, for_user=self.profile, rate=5)
+        RatingAggregate.objects.all().delete()
+
+        call_command('rebuild_rating_aggregates', stdout=StringIO())
+
+        aggregate = RatingAggregate.objects.get(pk=self.anime.pk)
+        self.assertEqual((aggregate.count, aggregate.total, aggregate.rate_5), (1, 5, 1))
+        self.assertEqual(RatingAggregate.objects.get(pk=self.other_anime.pk).count, 0)
+
+
+class KeysetPaginationTest(APITestCase):
+    def setUp(self):
+        # Create more comments than fit on one page
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        studio = Studio.objects.create(title='Studio 1')
+        self.profile = Profile.objects.create(
+            user=self.user,
+            nickname='TestUser',
+            birth_date='1990-06-06',
+            sex='male',
+            bio='',
+        )
+        self.anime = Anime.objects.create(
+            title='Test Anime',
+            description='Test description',
+            type='TV',
+            episodes=12,
+            ready_episodes=12,
+            length_of_episodes=24,
+            status='Ongoing',
+            age_rating='PG-13',
+            studio=studio,
+            year=2022,
+        )
+        self.comments = [
+            Comment.objects.create(user=self.profile, anime=self.anime, text=f'Comment {i}') for i in range(25)
+        ]
+
+    def test_cursor_pages_cover_all_rows_in_order(self):
+        url = '/catalog_api/comment-list/?pagination=cursor'
+        seen = []
+
+        while url:
+            # No COUNT(*): a single query per page
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(seen, sorted((comment.id for comment in self.comments), reverse=True))
+
+    def test_previous_link_returns_to_earlier_page(self):
+        first = self.client.get('/catalog_api/comment-list/', {'pagination': 'cursor', 'anime': 'Test Anime'})
+        self.assertIsNone(first.data['previous'])
+
+        second = self.client.get(first.data['next'])
+        previous = self.client.get(second.data['previous'])
+
+        self.assertEqual(
+            [item['id'] for item in previous.data['results']],
+            [item['id'] for item in first.data['results']],
+        )
+        self.assertIsNone(previous.data['previous'])
+
+    def test_page_number_mode_is_default(self):
+        response = self.client.get('/catalog_api/comment-list/')
+
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/catalog_api/comment-list/', {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_with_wrong_value_types(self):
+        for position in (['abc'], [{'a': 1}]):
+            cursor = urlsafe_b64encode(json.dumps({'p': position, 'r': 0}).encode()).decode().rstrip('=')
+            for url in ('/catalog_api/comment-list/', '/catalog_api/full-anime/'):
+                response = self.client.get(url, {'cursor': cursor})
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CatalogResponseCacheTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.studio = Studio.objects.create(title='Studio 1')
+        self.genre = Genre.objects.create(title='Genre 1')
+        self.anime = Anime.objects.create(
+            title='Anime 1',
+            description='Test description',
+            type='TV',
+            episodes=12,
+            ready_episodes=12,
+            length_of_episodes=24,
+            status='Ongoing',
+            age_rating='PG-13',
+            studio=self.studio,
+            year=2022,
+        )
+        self.other_anime = Anime.objects.create(
+            title='Anime 2',
+            description='Test description',
+            type='TV',
+            episodes=12,
+            ready_episodes=12,
+            length_of_episodes=24,
+            status='Ongoing',
+            age_rating='PG-13',
+            studio=self.studio,
+            year=2022,
+        )
+
+    def test_anonymous_list_is_served_from_cache(self):
+        first = self.client.get('/catalog_api/full-anime/', {'year': '2022', 'type': 'TV'})
+        self.assertEqual(first['X-Cache'], 'MISS')
+
+        # Same query in a different parameter order hits the cached entry without touching the DB
+        with self.assertNumQueries(0):
+            second = self.client.get('/catalog_api/full-anime/', {'type': 'TV', 'year': '2022'})
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.data, first.data)
+
+    def test_genre_change_invalidates_anime_list(self):
+        self.client.get('/catalog_api/full-anime/')
+        self.anime.genres.add(self.genre)
+
+        response = self.client.get('/catalog_api/full-anime/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][1]['genres'], ['Genre 1'])
+
+    def test_retrieve_invalidation_is_targeted(self):
+        self.client.get(f'/catalog_api/anime-retrieve/{self.anime.pk}/')
+        self.client.get(f'/catalog_api/anime-retrieve/{self.other_anime.pk}/')
+
+        self.anime.status = 'Completed'
+        self.anime.save()
+
+        response = self.client.get(f'/catalog_api/anime-retrieve/{self.anime.pk}/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['status'], 'Completed')
+        response = self.client.get(f'/catalog_api/anime-retrieve/{self.other_anime.pk}/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_studio_rename_invalidates_studio_list(self):
+        self.client.get('/catalog_api/studio-list/')
+        self.studio.title = 'Studio Renamed'
+        self.studio.save()
+
+        response = self.client.get('/catalog_api/studio-list/')
+        self.assertEqual(response.data['results'][0]['title'], 'Studio Renamed')
+
+    def test_cache_stats(self):
+        self.client.get('/catalog_api/genre-list/')
+        self.client.get('/catalog_api/genre-list/')
+
+        admin = User.objects.create_user(username='admin', password='adminpassword', is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(admin)}')
+        response = self.client.get('/catalog_api/cache-stats/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['hits'], response.data['misses']), (1, 1))
+
+
+class BenchmarkCatalogCommandTest(APITestCase):
+    def test_benchmark_rolls_back_seeded_rows(self):
+        out = StringIO()
+        call_command('benchmark_catalog', anime=50, studios=3, genres=5, repeat=1, compare=True, stdout=out)
+
+        self.assertIn('type=TV & status=Ongoing', out.getvalue())
+        self.assertFalse(Anime.objects.exists())
+
+    def test_rating_benchmark_rolls_back_seeded_rows(self):
+        out = StringIO()
+        call_command('benchmark_ratings', anime=20, users=30, per_user=5, repeat=1, stdout=out)
+
+        self.assertIn('Seeded 150 ratings', out.getvalue())
+        self.assertIn('rating-count endpoint', out.getvalue())
+        self.assertFalse(Rating.objects.exists())
+
+
+class IdFilterTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.profile = Profile.objects.create(
+            user=self.user,
+            nickname='TestUser',
+            birth_date='1990-06-06',
+            sex='male',
+            bio='',
+        )
+        self.studio = Studio.objects.create(title='Studio 1')
+        other_studio = Studio.objects.create(title='Studio 2')
+        self.genre = Genre.objects.create(title='Genre 1')
+
+        self.anime = Anime.objects.create(
+            title='Anime 1',
+            description='Test description',
+            type='TV',
+            episodes=12,
+            ready_episodes=12,
+            length_of_episodes=24,
+            status='Ongoing',
+            age_rating='PG-13',
+            studio=self.studio,
+            year=2022,
+        )
+        self.anime.genres.set([self.genre])
+        Anime.objects.create(
+            title='Anime 2',
+            description='Test description',
+            type='TV',
+            episodes=12,
+            ready_episodes=12,
+            length_of_episodes=24,
+            status='Ongoing',
+            age_rating='PG-13',
+            studio=other_studio,
+            year=2022,
+        )
+        Comment.objects.create(user=self.profile, anime=self.anime, text='Comment 1')
+
+    def test_filter_by_ids(self):
+        response = self.client.get('/catalog_api/full-anime/', {'studio_id': self.studio.id, 'genre_id': self.genre.id})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['title'] for item in response.data['results']], ['Anime 1'])
+
+    def test_titles_are_resolved_once(self):
+        # First request resolves the title, the second one reuses the cached id
+        with self.assertNumQueries(3):
+            response = self.client.get('/catalog_api/comment-list/', {'anime': 'Anime 1'})
+        self.assertEqual(response.data['count'], 1)
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/catalog_api/comment-list/', {'anime': 'Anime 1'})
+        self.assertEqual(response.data['count'], 1)
+
+    def test_renamed_title_is_not_served_from_cache(self):
+        self.client.get('/catalog_api/full-anime/', {'studio': 'Studio 1'})
+        self.studio.title = 'Studio Renamed'
+        self.studio.save()
+
+        response = self.client.get('/catalog_api/full-anime/', {'studio': 'Studio 1'})
+        self.assertEqual(response.data['count'], 0)
+        response = self.client.get('/catalog_api/full-anime/', {'studio': 'Studio Renamed'})
+        self.assertEqual(response.data['count'], 1)
+
+    def test_unknown_title_and_invalid_id(self):
+        response = self.client.get('/catalog_api/review-list/', {'anime': 'Unknown'})
+        self.assertEqual(response.data['count'], 0)
+
+        response = self.client.get('/catalog_api/full-anime/', {'studio_id': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class GenreFilterModeTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        studio = Studio.objects.create(title='Studio 1')
+        self.action = Genre.objects.create(title='Action')
+        self.comedy = Genre.objects.create(title='Comedy')
+        self.drama = Genre.objects.create(title='Drama')
+
+        def create_anime(title, genres):
+            anime = Anime.objects.create(
+                title=title,
+                description='Test description',
+                type='TV',
+                episodes=12,
+                ready_episodes=12,
+                length_of_episodes=24,
+                status='Ongoing',
+                age_rating='PG-13',
+                studio=studio,
+                year=2022,
+            )
+            anime.genres.set(genres)
+            return anime
+
+        create_anime('Action Comedy', [self.action, self.comedy])
+        create_anime('Action Only', [self.action])
+        create_anime('Drama Only', [self.drama])
+
+    def get_titles(self, params):
+        response = self.client.get('/catalog_api/full-anime/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['title'] for item in response.data['results']]
+
+    def test_any_mode_returns_each_anime_once(self):
+        titles = self.get_titles({'genres': ['Action', 'Comedy']})
+
+        self.assertEqual(titles, ['Action Only', 'Action Comedy'])
+
+    def test_all_mode_requires_every_genre(self):
+        titles = self.get_titles({'genres': ['Action', 'Comedy'], 'genres_mode': 'all'})
+        self.assertEqual(titles, ['Action Comedy'])
+
+        titles = self.get_titles({'genre_id': [self.action.id, self.drama.id], 'genres_mode': 'all'})
+        self.assertEqual(titles, [])
+
+    def test_all_mode_with_unknown_genre_matches_nothing(self):
+        titles = self.get_titles({'genres': ['Action', 'Unknown'], 'genres_mode': 'all'})
+
+        self.assertEqual(titles, [])
+
+    def test_invalid_mode(self):
+        response = self.client.get('/catalog_api/full-anime/', {'genres': ['Action'], 'genres_mode': 'some'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AnimeSearchAPITest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        studio = Studio.objects.create(title='Studio 1')
+
+        def create_anime(title, description):
+            return Anime.objects.create(
+                title=title,
+                description=description,
+                type='TV',
+                episodes=12,
+                ready_episodes=12,
+                length_of_episodes=24,
+                status='Ongoing',
+                age_rating='PG-13',
+                studio=studio,
+                year=2022,
+            )
+
+        self.alchemist = create_anime('Fullmetal Alchemist', 'Two brothers search for the philosopher stone.')
+        self.stone = create_anime('Dr. Stone', 'Humanity is petrified and science rebuilds the world.')
+        self.brothers = create_anime('Space Brothers', 'Two brothers dream of becoming astronauts.')
+
+    def test_prefix_search_ranks_title_matches_first(self):
+        response = self.client.get('/catalog_api/search/', {'q': 'ston'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['title'] for item in response.data['results']], ['Dr. Stone', 'Fullmetal Alchemist'])
+
+    def test_all_terms_must_match(self):
+        response = self.client.get('/catalog_api/search/', {'q': 'two brothers astro'})
+
+        self.assertEqual([item['title'] for item in response.data['results']], ['Space Brothers'])
+
+    def test_index_follows_anime_changes(self):
+        self.client.get('/catalog_api/search/', {'q': 'alchemist'})
+        self.alchemist.title = 'Fullmetal Alchemist: Brotherhood'
+        self.alchemist.save()
+
+        response = self.client.get('/catalog_api/search/', {'q': 'brotherhood'})
+        self.assertEqual([item['title'] for item in response.data['results']], ['Fullmetal Alchemist: Brotherhood'])
+
+    def test_query_is_required(self):
+        response = self.client.get('/catalog_api/search/', {'q': '  '})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AutocompleteAPITest(APITestCase):
+    def setUp(self):
+        self.mappa = Studio.objects.create(title='MAPPA')
+        self.madhouse = Studio.objects.create(title='Madhouse')
+        Genre.objects.create(title='Mecha')
+        Genre.objects.create(title='Magic')
+
+        def create_anime(title):
+            return Anime.objects.create(
+                title=title,
+                description='Description',
+                type='TV',
+                episodes=12,
+                ready_episodes=12,
+                length_of_episodes=24,
+                status='Ongoing',
+                age_rating='PG-13',
+                studio=self.mappa,
+                year=2022,
+            )
+
+        create_anime('Fullmetal Alchemist')
+        create_anime('Made in Abyss')
+        create_anime('Magi: The Labyrinth of Magic')
+
+    def test_suggestions_are_grouped_by_kind(self):
+        response = self.client.get('/catalog_api/autocomplete/', {'q': 'ma'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Title-start matches come first, shorter titles before longer ones
+        self.assertEqual([item['title'] for item in response.data['anime']], ['Made in Abyss', 'Magi: The Labyrinth of Magic'])
+        self.assertEqual([item['title'] for item in response.data['studios']], ['MAPPA', 'Madhouse'])
+        self.assertEqual([item['title'] for item in response.data['genres']], ['Magic'])
+
+    def test_matches_any_word_of_the_title(self):
+        response = self.client.get('/catalog_api/autocomplete/', {'q': 'alch', 'kind': 'anime'})
+
+        self.assertEqual(list(response.data), ['anime'])
+        self.assertEqual([item['title'] for item in response.data['anime']], ['Fullmetal Alchemist'])
+
+    def test_limit(self):
+        response = self.client.get('/catalog_api/autocomplete/', {'q': 'ma', 'kind': 'anime', 'limit': 1})
+
+        self.assertEqual([item['title'] for item in response.data['anime']], ['Made in Abyss'])
+
+    def test_suggestions_follow_title_changes(self):
+        self.client.get('/catalog_api/autocomplete/', {'q': 'ma'})
+        self.madhouse.title = 'Studio Pierrot'
+        self.madhouse.save()
+
+        response = self.client.get('/catalog_api/autocomplete/', {'q': 'pier', 'kind': 'studios'})
+        self.assertEqual([item['title'] for item in response.data['studios']], ['Studio Pierrot'])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/catalog_api/autocomplete/', {'q': ' '}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            self.client.get('/catalog_api/autocomplete/', {'q': 'ma', 'kind': 'users'}).status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+        self.assertEqual(
+            self.client.get('/catalog_api/autocomplete/', {'q': 'ma', 'limit': 100}).status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    def test_repeated_words_do_not_take_extra_slots(self):
+        trie = PrefixTrie(size=3, max_depth=3)
+        trie.insert(1, 'Alchemy Alchemy')
+        trie.insert(2, 'Alchemist')
+        trie.insert(3, 'United Alchemists')
+
+        # Short prefixes are answered from the per-node top entries, longer ones from the buckets
+        self.assertEqual([item['id'] for item in trie.search('al', 3)], [2, 1, 3])
+        self.assertEqual([item['id'] for item in trie.search('alchem', 3)], [2, 1, 3])
+
+    @skipUnless(connection.vendor == 'postgresql', 'gin_trgm_ops indexes are PostgreSQL only')
+    def test_autocomplete_uses_trigram_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = autocomplete_queryset('anime', 'ma').explain()
+
+        self.assertIn('anime_title_trgm_idx', plan)
+        self.assertNotIn('Seq Scan', plan)
+
+
+class ModeratorCacheTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='moderator', password='testpassword')
+        self.moderators = Group.objects.create(name='Moderators')
+        self.user.groups.add(self.moderators)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def create_genre(self, title):
+        return self.client.post('/catalog_api/genre-create/', {'title': title}, format='json')
+
+    def count_group_queries(self, title):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.create_genre(title)
+        return response, sum('auth_user_groups' in query['sql'] for query in queries.captured_queries)
+
+    def test_membership_is_cached_across_requests(self):
+        response, group_queries = self.count_group_queries('Genre 1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(group_queries, 1)
+
+        response, group_queries = self.count_group_queries('Genre 2')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(group_queries, 0)
+
+    def test_removal_from_group_takes_effect(self):
+        self.assertEqual(self.create_genre('Genre 1').status_code, status.HTTP_201_CREATED)
+
+        self.user.groups.remove(self.moderators)
+        self.assertEqual(self.create_genre('Genre 2').status_code, status.HTTP_403_FORBIDDEN)
+
+        # Changes made from the group side are picked up as well
+        self.moderators.user_set.add(self.user)
+        self.assertEqual(self.create_genre('Genre 3').status_code, status.HTTP_201_CREATED)
+        self.moderators.user_set.clear()
+        self.assertEqual(self.create_genre('Genre 4').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_renamed_group_is_no_longer_moderators(self):
+        self.assertEqual(self.create_genre('Genre 1').status_code, status.HTTP_201_CREATED)
+
+        self.moderators.name = 'Former moderators'
+        self.moderators.save()
+        self.assertEqual(self.create_genre('Genre 2').status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(AUTH_TRUST_TOKEN_CLAIMS=True)
+class StatelessJWTAuthenticationTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.profile = Profile.objects.create(
+            user=self.user,
+            nickname='TestUser',
+            birth_date='1990-06-06',
+            sex='male',
+            bio='',
+        )
+        self.moderators = Group.objects.create(name='Moderators')
+        self.user.groups.add(self.moderators)
+
+        studio = Studio.objects.create(title='Studio 1')
+        self.anime = Anime.objects.create(
+            title='Test Anime',
+            description='Test description',
+            type='TV',
+            episodes=12,
+            ready_episodes=12,
+            length_of_episodes=24,
+            status='Ongoing',
+            age_rating='PG-13',
+            studio=studio,
+            year=2022,
+        )
+
+        # Start without the revocations recorded by the setup above. The token is usually issued in the
+        # same second as the changes the tests make.
+        cache.clear()
+        self.refresh = CatalogRefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+
+    def count_user_queries(self, url, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data, format='json')
+        return response, sum('"auth_user' in query['sql'] for query in queries.captured_queries)
+
+    def test_tokens_carry_claims(self):
+        token = AccessToken(str(self.refresh.access_token))
+
+        self.assertEqual(token['profile_id'], self.profile.id)
+        self.assertTrue(token['is_moderator'])
+        self.assertFalse(token['is_staff'])
+
+    def test_registration_tokens_carry_the_profile(self):
+        response = self.client.post('/catalog_api/register/', {
+            'username': 'newuser',
+            'password': 'testpassword',
+            'nickname': 'NewUser',
+            'email': 'newuser@example.com',
+            'bio': 'Test bio',
+            'sex': 'male',
+            'birth_date': '1990-01-01',
+        }, format='json')
+
+        token = AccessToken(response.data['access_token'])
+        self.assertEqual(token['profile_id'], Profile.objects.get(nickname='NewUser').id)
+
+    def test_writes_need_no_user_queries(self):
+        response, _ = self.count_user_queries('/catalog_api/comment-create/', {'text': 'First', 'anime': self.anime.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # The account check is cached, the moderator flag comes from the token
+        response, user_queries = self.count_user_queries('/catalog_api/comment-create/', {'text': 'Second', 'anime': self.anime.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(user_queries, 0)
+
+        response, user_queries = self.count_user_queries('/catalog_api/genre-create/', {'title': 'Genre 1'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(user_queries, 0)
+
+    def test_deactivated_account_is_refused(self):
+        self.assertEqual(self.client.get('/catalog_api/collection-list/').status_code, status.HTTP_200_OK)
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.client.get('/catalog_api/collection-list/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_role_change_revokes_claims(self):
+        self.user.groups.remove(self.moderators)
+
+        response = self.client.post('/catalog_api/genre-create/', {'title': 'Genre 1'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # Refreshing issues an access token with the current claims
+        response = self.client.post('/api/token/refresh/', {'refresh': str(self.refresh)}, format='json')
+        self.assertFalse(AccessToken(response.data['access'])['is_moderator'])
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        response = self.client.post('/catalog_api/genre-create/', {'title': 'Genre 1'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(AUTH_TRUST_TOKEN_CLAIMS=False)
+    def test_role_claims_are_ignored_without_a_shared_cache(self):
+        self.user.groups.remove(self.moderators)
+
+        # The token still says moderator, but the role is read from the database
+        response, user_queries = self.count_user_queries('/catalog_api/genre-create/', {'title': 'Genre 1'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertGreater(user_queries, 0)
+
+
+class RequestProfileTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.profile = Profile.objects.create(
+            user=self.user,
+            nickname='TestUser',
+            birth_date='1990-06-06',
+            sex='male',
+            bio='',
+        )
+
+        studio = Studio.objects.create(title='Studio 1')
+        self.anime = Anime.objects.create(
+            title='Test Anime',
+            description='Test description',
+            type='TV',
+            episodes=12,
+            ready_episodes=12,
+            length_of_episodes=24,
+            status='Ongoing',
+            age_rating='PG-13',
+            studio=studio,
+            year=2022,
+        )
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def create_comment(self, text):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/catalog_api/comment-create/', {'text': text, 'anime': self.anime.id}, format='json')
+        profile_queries = [query for query in queries.captured_queries if 'FROM "anime_catalog_profile"' in query['sql']]
+        return response, len(profile_queries)
+
+    def test_profile_is_cached_across_requests(self):
+        response, profile_queries = self.create_comment('First')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(profile_queries, 1)
+
+        response, profile_queries = self.create_comment('Second')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(profile_queries, 0)
+        self.assertEqual(Comment.objects.filter(user=self.profile).count(), 2)
+
+    def test_deleted_profile_is_forgotten(self):
+        self.create_comment('First')
+        self.profile.delete()
+
+        response, _ = self.create_comment('Second')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class OwnedObjectLookupTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+        def create_profile(username):
+            user = User.objects.create_user(username=username, password='testpassword')
+            profile = Profile.objects.create(user=user, nickname=username, birth_date='1990-06-06', sex='male', bio='')
+            return user, profile
+
+        self.owner, self.owner_profile = create_profile('owner')
+        self.other, self.other_profile = create_profile('other')
+
+        studio = Studio.objects.create(title='Studio 1')
+        self.anime = Anime.objects.create(
+            title='Test Anime',
+            description='Test description',
+            type='TV',
+            episodes=12,
+            ready_episodes=12,
+            length_of_episodes=24,
+            status='Ongoing',
+            age_rating='PG-13',
+            studio=studio,
+            year=2022,
+        )
+        self.comment = Comment.objects.create(user=self.owner_profile, anime=self.anime, text='Test comment')
+        self.url = f'/catalog_api/comment-update/{self.comment.pk}/'
+
+    def authenticate(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {CatalogRefreshToken.for_user(user).access_token}')
+
+    def test_owner_update_is_one_lookup(self):
+        self.authenticate(self.owner)
+        # Warm the account and profile caches
+        self.client.get(self.url)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(self.url, {'text': 'Updated', 'anime': self.anime.id}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lookups = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('SELECT')]
+        # The scoped comment lookup and the serializer's anime validation, no profile or user rows
+        self.assertEqual(len(lookups), 2)
+        self.assertFalse(any('anime_catalog_profile' in sql or '"auth_user' in sql for sql in lookups))
+
+    def test_other_users_objects_are_not_found(self):
+        self.authenticate(self.other)
+
+        response = self.client.put(self.url, {'text': 'Updated', 'anime': self.anime.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.delete(f'/catalog_api/comment-delete/{self.comment.pk}/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.text, 'Test comment')
+
+
+class CommentThreadAPITest(APITestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        self.profile = Profile.objects.create(user=user, nickname='TestUser', birth_date='1990-06-06', sex='male', bio='')
+        studio = Studio.objects.create(title='Studio 1')
+        self.anime = Anime.objects.create(
+            title='Test Anime',
+            description='Test description',
+            type='TV',
+            episodes=12,
+            ready_episodes=12,
+            length_of_episodes=24,
+            status='Ongoing',
+            age_rating='PG-13',
+            studio=studio,
+            year=2022,
+        )
+        self.url = f'/catalog_api/anime-retrieve/{self.anime.id}/comments/'
+
+        def comment(text, parent=None):
+            return Comment.objects.create(user=self.profile, anime=self.anime, text=text, parent=parent)
+
+        # first
+        # ├── reply 1
+        # │   └── reply 1.1
+        # │       └── reply 1.1.1
+        # ├── reply 2
+        # └── reply 3
+        # second
+        self.first = comment('first')
+        reply = comment('reply 1', self.first)
+        reply = comment('reply 1.1', reply)
+        comment('reply 1.1.1', reply)
+        comment('reply 2', self.first)
+        comment('reply 3', self.first)
+        self.second = comment('second')
+
+    def test_threads_are_nested(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Newest thread first, replies in creation order
+        first = response.data['results'][1]
+        self.assertEqual([thread['text'] for thread in response.data['results']], ['second', 'first'])
+        self.assertEqual([reply['text'] for reply in first['replies']], ['reply 1', 'reply 2', 'reply 3'])
+        # Replies at any depth are counted
+        self.assertEqual((first['reply_count'], first['replies'][0]['reply_count']), (5, 2))
+        self.assertEqual(first['replies'][0]['replies'][0]['replies'][0]['text'], 'reply 1.1.1')
+        self.assertEqual(first['replies'][0]['user'], 'TestUser')
+
+    def test_depth_and_breadth_limits(self):
+        response = self.client.get(self.url, {'max_depth': 2, 'max_replies': 2})
+
+        first = response.data['results'][1]
+        self.assertEqual([reply['text'] for reply in first['replies']], ['reply 1', 'reply 2'])
+        self.assertEqual(first['reply_count'], 5)
+        # reply 1.1 is at the depth limit: its own reply is counted but not included
+        reply = first['replies'][0]['replies'][0]
+        self.assertEqual((reply['text'], reply['reply_count'], reply['replies']), ('reply 1.1', 1, []))
+
+    def test_query_count_does_not_depend_on_thread_size(self):
+        # Page count, top-level comments, every reply
+        with self.assertNumQueries(3):
+            self.client.get(self.url, {'max_depth': 10})
+
+    def test_breadth_is_limited_in_the_query(self):
+        replies = fetch_descendants([self.first], MAX_THREAD_DEPTH, 2)
+
+        # reply 3 is never read
+        self.assertEqual([reply.text for reply in replies], ['reply 1', 'reply 1.1', 'reply 1.1.1', 'reply 2'])
+
+    def test_unknown_anime(self):
+        response = self.client.get('/catalog_api/anime-retrieve/0/comments/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # An anime without comments is an empty page
+        Comment.objects.all().delete()
+        response = self.client.get(self.url)
+        self.assertEqual((response.status_code, response.data['results']), (status.HTTP_200_OK, []))
+
+    def test_top_level_threads_are_paginated(self):
+        for i in range(10):
+            Comment.objects.create(user=self.profile, anime=self.anime, text=f'thread {i}')
+
+        response = self.client.get(self.url, {'pagination': 'cursor'})
+        self.assertEqual(len(response.data['results']), 10)
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([thread['text'] for thread in response.data['results']], ['second', 'first'])
+        self.assertEqual(len(response.data['results'][1]['replies']), 3)
+
+    def test_invalid_limits(self):
+        self.assertEqual(self.client.get(self.url, {'max_depth': 11}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {'max_replies': 'x'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CommentPathTest(APITestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        self.profile = Profile.objects.create(user=user, nickname='TestUser', birth_date='1990-06-06', sex='male', bio='')
+        studio = Studio.objects.create(title='Studio 1')
+        self.anime = Anime.objects.create(
+            title='Test Anime',
+            description='Test description',
+            type='TV',
+            episodes=12,
+            ready_episodes=12,
+            length_of_episodes=24,
+            status='Ongoing',
+            age_rating='PG-13',
+            studio=studio,
+            year=2022,
+        )
+
+        self.root = self.comment('root')
+        self.reply = self.comment('reply', self.root)
+        self.nested = self.comment('nested', self.reply)
+        self.sibling = self.comment('sibling', self.root)
+        self.other = self.comment('other')
+
+    def comment(self, text, parent=None):
+        return Comment.objects.create(user=self.profile, anime=self.anime, text=text, parent=parent)
+
+    def test_path_is_set_on_insert(self):
+        self.nested.refresh_from_db()
+
+        self.assertEqual(self.nested.path, path_segment(self.root.id) + path_segment(self.reply.id) + path_segment(self.nested.id))
+        self.assertEqual(self.nested.depth, 2)
+        self.assertEqual(list(self.root.get_descendants()), [self.reply, self.nested, self.sibling])
+
+    def test_subtree_endpoint(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/catalog_api/comment-retrieve/{self.root.id}/replies/')
+
+        self.assertEqual(response.data['text'], 'root')
+        self.assertEqual([reply['text'] for reply in response.data['replies']], ['reply', 'sibling'])
+        self.assertEqual(response.data['replies'][0]['replies'][0]['text'], 'nested')
+
+    def test_delete_removes_the_subtree(self):
+        self.root.delete()
+
+        self.assertEqual(list(Comment.objects.values_list('text', flat=True)), ['other'])
+
+    def test_reply_counts_follow_inserts_and_deletes(self):
+        counts = lambda: dict(Comment.objects.values_list('text', 'reply_count'))
+        self.assertEqual(counts(), {'root': 3, 'reply': 1, 'nested': 0, 'sibling': 0, 'other': 0})
+
+        self.reply.delete()
+        self.assertEqual(counts(), {'root': 1, 'sibling': 0, 'other': 0})
+
+        Comment.objects.update(reply_count=0)
+        call_command('backfill_comment_paths', stdout=StringIO())
+        self.assertEqual(counts(), {'root': 1, 'sibling': 0, 'other': 0})
+
+        Comment.objects.update(reply_count=0)
+        import_module('anime_catalog.migrations.0027_comment_reply_count').count_replies(apps, None)
+        self.assertEqual(counts(), {'root': 1, 'sibling': 0, 'other': 0})
+
+    def test_comments_cannot_be_moved(self):
+        self.client.force_authenticate(self.profile.user)
+        url = f'/catalog_api/comment-update/{self.reply.id}/'
+
+        for parent in (self.reply.id, self.other.id):
+            response = self.client.put(url, {'text': 'Moved', 'anime': self.anime.id, 'parent': parent}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.reply.refresh_from_db()
+        self.assertEqual((self.reply.text, self.reply.parent_id), ('Moved', self.root.id))
+        self.assertEqual(
+            [reply['text'] for reply in self.client.get(f'/catalog_api/comment-retrieve/{self.root.id}/replies/').data['replies']],
+            ['Moved', 'sibling'],
+        )
+
+    def test_backfill_command(self):
+        expected = dict(Comment.objects.values_list('id', 'path'))
+        Comment.objects.update(path='', depth=0)
+
+        out = StringIO()
+        call_command('backfill_comment_paths', batch_size=2, stdout=out)
+
+        self.assertIn('Backfilled the paths of 5 comments', out.getvalue())
+        self.assertEqual(dict(Comment.objects.values_list('id', 'path')), expected)
+        self.assertEqual(Comment.objects.get(id=self.nested.id).depth, 2)
+
+    def test_migration_backfill(self):
+        expected = dict(Comment.objects.values_list('id', 'path'))
+        Comment.objects.update(path='', depth=0)
+
+        import_module('anime_catalog.migrations.0020_comment_path').backfill_paths(apps, None)
+
+        self.assertEqual(dict(Comment.objects.values_list('id', 'path')), expected)
+        self.assertEqual(Comment.objects.get(id=self.nested.id).depth, 2)
+
+    def test_replies_beyond_the_path_length_are_rejected(self):
+        parent = self.root
+        for depth in range(MAX_COMMENT_DEPTH):
+            parent = self.comment(f'level {depth + 1}', parent)
+
+        self.client.force_authenticate(self.profile.user)
+        response = self.client.post('/catalog_api/comment-create/', {'text': 'Too deep', 'anime': self.anime.id, 'parent': parent.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise SMTPException('Connection unexpectedly closed')
+
+
+class ReplyNotificationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        # The Comment signals queue Celery tasks: run them inline
+        self.addCleanup(celery_app.conf.update, task_always_eager=celery_app.conf.task_always_eager)
+        celery_app.conf.update(task_always_eager=True)
+
+        def create_profile(username):
+            user = User.objects.create_user(username=username, password='testpassword', email=f'{username}@example.com')
+            return Profile.objects.create(user=user, nickname=username, birth_date='1990-06-06', sex='male', bio='')
+
+        self.author = create_profile('author')
+        self.other = create_profile('other')
+        self.replier = create_profile('replier')
+
+        studio = Studio.objects.create(title='Studio 1')
+        self.anime = Anime.objects.create(
+            title='Test Anime',
+            description='Test description',
+            type='TV',
+            episodes=12,
+            ready_episodes=12,
+            length_of_episodes=24,
+            status='Ongoing',
+            age_rating='PG-13',
+            studio=studio,
+            year=2022,
+        )
+        self.first = self.comment(self.author, 'first')
+        self.second = self.comment(self.author, 'second')
+        self.third = self.comment(self.other, 'third')
+
+    def comment(self, profile, text, parent=None):
+        # Notifications are queued once the transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            return Comment.objects.create(user=profile, anime=self.anime, text=text, parent=parent)
+
+    def test_replies_within_the_window_are_one_digest(self):
+        # A flush is already scheduled for this window
+        cache.add(FLUSH_SCHEDULED_KEY, True)
+        self.comment(self.replier, 'reply 1', self.first)
+        self.comment(self.replier, 'reply 2', self.second)
+        self.comment(self.replier, 'reply 3', self.first)
+        self.comment(self.replier, 'reply 4', self.third)
+        self.assertEqual(len(mail.outbox), 0)
+
+        self.assertEqual(flush_reply_notifications(), 2)
+
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['author@example.com', 'other@example.com'])
+        digest = next(message for message in mail.outbox if message.to == ['author@example.com'])
+        self.assertEqual(digest.subject, 'You have received 3 responses to your comments')
+        self.assertIn('reply 1', digest.body)
+        self.assertIn('reply 3', digest.body)
+        self.assertFalse(ReplyNotification.objects.exists())
+
+    def test_first_reply_schedules_a_flush(self):
+        # Tasks run eagerly in tests, so the scheduled flush sends right away
+        self.comment(self.replier, 'reply', self.first)
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['author@example.com'])
+        self.assertEqual(mail.outbox[0].subject, 'You have received a response to your comment')
+
+    def test_replies_to_yourself_are_not_notified(self):
+        self.comment(self.author, 'reply', self.first)
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertFalse(ReplyNotification.objects.exists())
+
+    def test_nothing_is_queued_before_commit_or_on_rollback(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                Comment.objects.create(user=self.replier, anime=self.anime, text='rolled back', parent=self.first)
+                transaction.set_rollback(True)
+            with self.assertNumQueries(5):
+                # Savepoint, insert, path update, ancestor reply counts, release: no lookups for the
+                # notification, and the trending counter waits for the commit too
+                Comment.objects.create(user=self.replier, anime=self.anime, text='reply', parent=self.first)
+
+        self.assertEqual(len(callbacks), 2)
+        self.assertFalse(ReplyNotification.objects.exists())
+
+    def test_task_resolves_the_reply_in_one_query(self):
+        cache.add(FLUSH_SCHEDULED_KEY, True)
+        with self.captureOnCommitCallbacks() as callbacks:
+            reply = Comment.objects.create(user=self.replier, anime=self.anime, text='reply', parent=self.first)
+
+        with self.assertNumQueries(2):
+            # The reply with its parent, then the buffered row
+            buffer_reply(reply.id)
+        self.assertEqual(ReplyNotification.objects.get().recipient, self.author)
+
+    def test_failed_send_keeps_the_digest(self):
+        cache.add(FLUSH_SCHEDULED_KEY, True)
+        self.comment(self.replier, 'reply', self.first)
+
+        with override_settings(EMAIL_BACKEND='anime_catalog.tests.FailingEmailBackend'):
+            with self.assertRaises(SMTPException):
+                flush_reply_notifications()
+        self.assertEqual(ReplyNotification.objects.get().recipient, self.author)
+
+        flush_reply_notifications()
+        self.assertEqual(mail.outbox[0].to, ['author@example.com'])
+        self.assertFalse(ReplyNotification.objects.exists())
+
+    def test_stranded_notifications_are_swept(self):
+        # Buffered while a flush was marked as scheduled, but that flush never runs
+        cache.add(FLUSH_SCHEDULED_KEY, True)
+        self.comment(self.replier, 'reply', self.first)
+        self.assertEqual(len(mail.outbox), 0)
+
+        sweep = settings.CELERY_BEAT_SCHEDULE['flush-reply-notifications']
+        self.assertEqual(sweep['task'], flush_reply_notifications_task.name)
+        flush_reply_notifications()
+
+        self.assertEqual(mail.outbox[0].to, ['author@example.com'])
+        self.assertFalse(ReplyNotification.objects.exists())
+
+
+class AnimeImportTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.studio = Studio.objects.create(title='Studio 1')
+        Genre.objects.create(title='Action')
+
+    def row(self, title, **fields):
+        row = {
+            'title': title,
+            'description': 'An imported anime description. ' * 5,
+            'type': 'TV',
+            'episodes': 12,
+            'ready_episodes': 12,
+            'length_of_episodes': 24,
+            'status': 'Completed',
+            'age_rating': 'PG-13',
+            'studio': 'Studio 1',
+            'genres': ['Action', 'Drama'],
+            'year': 2020,
+        }
+        row.update(fields)
+        return row
+
+    def write(self, suffix, content):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'w', newline='') as file:
+            file.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_command_imports_jsonl(self):
+        rows = [self.row('Imported 1'), self.row('Imported 2', studio='New Studio'), self.row('Imported 1'), self.row('Bad', year=1800)]
+        path = self.write('.jsonl', '\n'.join(json.dumps(row) for row in rows))
+
+        out, err = StringIO(), StringIO()
+        call_command('import_anime', path, batch_size=2, stdout=out, stderr=err)
+
+        self.assertIn('2 created, 1 skipped, 1 invalid', out.getvalue())
+        self.assertIn('Row 4', err.getvalue())
+        anime = Anime.objects.get(title='Imported 2')
+        self.assertEqual(anime.studio.title, 'New Studio')
+        self.assertEqual(set(anime.genres.values_list('title', flat=True)), {'Action', 'Drama'})
+        self.assertEqual(Genre.objects.filter(title='Action').count(), 1)
+        self.assertTrue(RatingAggregate.objects.filter(anime=anime).exists())
+
+    def test_command_imports_csv(self):
+        existing = self.row('Existing', studio=self.studio)
+        del existing['genres']
+        Anime.objects.create(**existing)
+        header = 'title,description,type,episodes,ready_episodes,length_of_episodes,status,age_rating,studio,genres,year'
+        lines = [header] + [
+            f'{title},{"An imported anime description. " * 5},TV,12,12,24,Completed,PG-13,Studio 1,Action|Comedy,2021'
+            for title in ('Existing', 'From CSV')
+        ]
+        path = self.write('.csv', '\n'.join(lines))
+
+        out = StringIO()
+        call_command('import_anime', path, stdout=out)
+
+        self.assertIn('1 created, 1 skipped, 0 invalid', out.getvalue())
+        anime = Anime.objects.get(title='From CSV')
+        self.assertEqual(set(anime.genres.values_list('title', flat=True)), {'Action', 'Comedy'})
+
+    def test_existing_anime_without_aggregates_is_skipped(self):
+        existing = self.row('Existing', studio=self.studio)
+        del existing['genres']
+        Anime.objects.bulk_create([Anime(**existing)])
+        path = self.write('.jsonl', '\n'.join(json.dumps(self.row(title)) for title in ('Existing', 'Imported 1')))
+
+        out = StringIO()
+        call_command('import_anime', path, stdout=out)
+
+        self.assertIn('1 created, 1 skipped, 0 invalid', out.getvalue())
+        self.assertFalse(Anime.objects.get(title='Existing').genres.exists())
+        self.assertEqual(RatingAggregate.objects.get().anime.title, 'Imported 1')
+
+    def test_titles_committed_after_the_check_are_dropped(self):
+        # As if a concurrent import created 'Existing' between import_chunk's check and its insert
+        existing = self.row('Existing', studio=self.studio)
+        del existing['genres']
+        Anime.objects.create(**existing)
+        rows = [AnimeImportSerializer(data=self.row(title)) for title in ('Existing', 'Imported 1')]
+        rows = [row.validated_data for row in rows if row.is_valid(raise_exception=True)]
+
+        rows, anime = insert_anime(rows, {'Studio 1': self.studio.id})
+
+        self.assertEqual([row['title'] for row in rows], ['Imported 1'])
+        self.assertEqual([item.title for item in anime], ['Imported 1'])
+        self.assertIsNotNone(anime[0].id)
+
+    def test_malformed_lines_are_invalid_rows(self):
+        lines = [json.dumps(self.row('Imported 1')), '{"title": "Broken",', '', json.dumps(self.row('Imported 2'))]
+        path = self.write('.jsonl', '\n'.join(lines))
+
+        out, err = StringIO(), StringIO()
+        call_command('import_anime', path, batch_size=1, stdout=out, stderr=err)
+
+        self.assertIn('2 created, 0 skipped, 1 invalid', out.getvalue())
+        self.assertIn('Row 2', err.getvalue())
+        self.assertIn('Line 2 is not valid JSON', err.getvalue())
+        self.assertEqual(Anime.objects.count(), 2)
+
+    def test_import_is_visible_in_cached_lists(self):
+        self.assertEqual(self.client.get('/catalog_api/short-anime/').data['results'], [])
+        path = self.write('.jsonl', json.dumps(self.row('Imported 1')))
+        call_command('import_anime', path, stdout=StringIO())
+
+        response = self.client.get('/catalog_api/short-anime/')
+        self.assertEqual([anime['title'] for anime in response.data['results']], ['Imported 1'])
+
+    def test_api_requires_moderator(self):
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+        response = self.client.post('/catalog_api/anime-import/', [self.row('Imported 1')], format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(Anime.objects.exists())
+
+    def test_api_imports_rows(self):
+        user = User.objects.create_user(username='admin', password='testpassword', is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+        response = self.client.post('/catalog_api/anime-import/', [self.row('Imported 1'), self.row('')], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['created'], response.data['invalid']), (1, 1))
+        self.assertIn('title', response.data['errors'][0]['errors'])
+
+        response = self.client.post('/catalog_api/anime-import/', {'title': 'Not a list'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AnimeExportTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        studio = Studio.objects.create(title='Studio 1')
+        action, drama = Genre.objects.create(title='Action'), Genre.objects.create(title='Drama')
+        for number in range(5):
+            anime = Anime.objects.create(
+                title=f'Anime {number}',
+                description='An exported anime description. ' * 5,
+                type='TV',
+                episodes=12,
+                ready_episodes=12,
+                length_of_episodes=24,
+                status='Completed',
+                age_rating='PG-13',
+                studio=studio,
+                year=2020,
+            )
+            anime.genres.add(action)
+            if number % 2:
+                anime.genres.add(drama)
+
+    def test_command_exports_jsonl(self):
+        out = StringIO()
+        call_command('export_anime', chunk_size=2, stdout=out)
+
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['title'] for row in rows], [f'Anime {number}' for number in range(5)])
+        self.assertEqual(rows[1]['studio'], 'Studio 1')
+        self.assertEqual(rows[0]['genres'], ['Action'])
+        self.assertEqual(rows[1]['genres'], ['Action', 'Drama'])
+
+    def test_queries_grow_with_chunks_only(self):
+        with CaptureQueriesContext(connection) as queries:
+            out = StringIO()
+            call_command('export_anime', chunk_size=2, stdout=out)
+        # Genre titles, the anime cursor and one genre lookup per chunk of two
+        self.assertLessEqual(len(queries), 1 + 3 + 3)
+
+    def test_genres_created_during_the_export(self):
+        rows = iter_anime(chunk_size=2)
+        self.assertEqual(next(rows)['title'], 'Anime 0')
+
+        Anime.objects.get(title='Anime 4').genres.add(Genre.objects.create(title='Mecha'))
+
+        self.assertEqual([row['genres'] for row in rows][-1], ['Action', 'Mecha'])
+
+    def test_export_can_be_imported(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'anime.csv')
+        call_command('export_anime', path, format='csv')
+        Anime.objects.all().delete()
+
+        out = StringIO()
+        call_command('import_anime', path, stdout=out)
+        self.assertIn('5 created', out.getvalue())
+        self.assertEqual(Anime.objects.get(title='Anime 3').genres.count(), 2)
+
+    def test_api_streams_csv(self):
+        user = User.objects.create_user(username='admin', password='testpassword', is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+        response = self.client.get('/catalog_api/anime-export/', {'output': 'csv'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertIn('Action|Drama', lines[2])
+
+        response = self.client.get('/catalog_api/anime-export/', {'output': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_api_requires_moderator(self):
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+        response = self.client.get('/catalog_api/anime-export/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class RatingBulkAPITest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.profile = Profile.objects.create(
+            user=self.user,
+            nickname='TestUser',
+            birth_date='1990-06-06',
+            sex='male',
+            bio='',
+        )
+        studio = Studio.objects.create(title='Studio 1')
+        self.anime = [
+            Anime.objects.create(
+                title=f'Anime {number}',
+                description='Test description',
+                type='TV',
+                episodes=12,
+                ready_episodes=12,
+                length_of_episodes=24,
+                status='Ongoing',
+                age_rating='PG-13',
+                studio=studio,
+                year=2022,
+            )
+            for number in range(4)
+        ]
+        Rating.objects.create(for_anime=self.anime[0], for_user=self.profile, rate=3)
+        Rating.objects.create(for_anime=self.anime[1], for_user=self.profile, rate=8)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def post(self, ratings):
+        return self.client.post('/catalog_api/rating-bulk/', {'ratings': ratings}, format='json')
+
+    def test_upserts_ratings_and_aggregates(self):
+        response = self.post([
+            {'for_anime': 'Anime 0', 'rate': 9},
+            {'for_anime': 'Anime 1', 'rate': 8},
+            {'for_anime': 'Anime 2', 'rate': 4},
+            {'for_anime': 'Anime 2', 'rate': 5},
+            {'for_anime': 'Missing', 'rate': 5},
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'created': 1, 'updated': 1, 'unchanged': 1, 'unknown': ['Missing']})
+        self.assertEqual(
+            dict(Rating.objects.filter(for_user=self.profile).values_list('for_anime__title', 'rate')),
+            {'Anime 0': 9, 'Anime 1': 8, 'Anime 2': 5},
+        )
+
+        aggregates = {aggregate.anime_id: aggregate for aggregate in RatingAggregate.objects.all()}
+        self.assertEqual(aggregates[self.anime[0].id].distribution(), {9: 1})
+        self.assertEqual(aggregates[self.anime[2].id].distribution(), {5: 1})
+        self.assertEqual(aggregates[self.anime[2].id].average, 5)
+
+        expected = {anime_id: aggregate.distribution() for anime_id, aggregate in aggregates.items()}
+        call_command('rebuild_rating_aggregates', stdout=StringIO())
+        self.assertEqual({aggregate.anime_id: aggregate.distribution() for aggregate in RatingAggregate.objects.all()}, expected)
+
+    def test_query_count_does_not_grow_with_batch(self):
+        ratings = [{'for_anime': anime.title, 'rate': 6} for anime in self.anime]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(ratings)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Account check, titles, profile, savepoint pair, profile lock, previous rates, upsert and three
+        # aggregate queries; the trending counters run after the commit
+        self.assertLessEqual(len(queries), 11)
+
+    def test_invalid_batches_are_rejected(self):
+        self.assertEqual(self.post([]).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.post([{'for_anime': 'Anime 0', 'rate': 11}]).status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.credentials()
+        self.assertEqual(self.post([{'for_anime': 'Anime 0', 'rate': 5}]).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class UpsertAPITest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.profile = Profile.objects.create(
+            user=self.user,
+            nickname='TestUser',
+            birth_date='1990-06-06',
+            sex='male',
+            bio='',
+        )
+        studio = Studio.objects.create(title='Studio 1')
+        self.anime = Anime.objects.create(
+            title='Test Anime',
+            description='Test description',
+            type='TV',
+            episodes=12,
+            ready_episodes=12,
+            length_of_episodes=24,
+            status='Ongoing',
+            age_rating='PG-13',
+            studio=studio,
+            year=2022,
+        )
+        self.review_data = {
+            'storyline': 4,
+            'characters': 4,
+            'artwork': 5,
+            'sound_series': 3,
+            'final_grade': 4,
+            'text': 'A review long enough to pass validation. ' * 5,
+        }
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_rating_put_is_idempotent(self):
+        url = f'/catalog_api/anime-retrieve/{self.anime.id}/rating/'
+        for _ in range(2):
+            response = self.client.put(url, {'rate': 7}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data, {'for_anime': 'Test Anime', 'rate': 7})
+
+        response = self.client.put(url, {'rate': 2}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Rating.objects.get(for_user=self.profile).rate, 2)
+        self.assertEqual(RatingAggregate.objects.get(anime=self.anime).distribution(), {2: 1})
+
+    def test_review_put_is_idempotent(self):
+        url = f'/catalog_api/anime-retrieve/{self.anime.id}/review/'
+        response = self.client.put(url, self.review_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['anime'], 'Test Anime')
+        self.assertEqual(response.data['user'], 'TestUser')
+        date = Review.objects.get().date
+
+        response = self.client.put(url, {**self.review_data, 'final_grade': 2}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['final_grade'], 2)
+
+        review = Review.objects.get()
+        self.assertEqual((review.final_grade, review.user_id, review.date), (2, self.profile.id, date))
+
+    def test_invalid_puts(self):
+        response = self.client.put('/catalog_api/anime-retrieve/0/rating/', {'rate': 7}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.put(f'/catalog_api/anime-retrieve/{self.anime.id}/rating/', {'rate': 0}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.put(f'/catalog_api/anime-retrieve/{self.anime.id}/review/', {**self.review_data, 'text': 'short'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Review.objects.exists())
+
+
+class TopRatedAPITest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.studios = [Studio.objects.create(title='Studio 1'), Studio.objects.create(title='Studio 2')]
+        self.action = Genre.objects.create(title='Action')
+        self.anime = {}
+        for title, studio, year in (('Many Nines', 0, 2020), ('One Ten', 0, 2021), ('Many Sevens', 1, 2020), ('Unrated', 1, 2020)):
+            self.anime[title] = Anime.objects.create(
+                title=title,
+                description='Test description',
+                type='TV',
+                episodes=12,
+                ready_episodes=12,
+                length_of_episodes=24,
+                status='Completed',
+                age_rating='PG-13',
+                studio=self.studios[studio],
+                year=year,
+            )
+        self.anime['Many Nines'].genres.add(self.action)
+        self.anime['One Ten'].genres.add(self.action)
+
+        self.profiles = []
+        for number in range(6):
+            user = User.objects.create_user(username=f'user{number}', password='testpassword')
+            self.profiles.append(Profile.objects.create(
+                user=user, nickname=f'User{number}', birth_date='1990-06-06', sex='male', bio='',
+            ))
+            Rating.objects.create(for_anime=self.anime['Many Nines'], for_user=self.profiles[-1], rate=9)
+            Rating.objects.create(for_anime=self.anime['Many Sevens'], for_user=self.profiles[-1], rate=7)
+        Rating.objects.create(for_anime=self.anime['One Ten'], for_user=self.profiles[0], rate=10)
+
+    def titles(self, **params):
+        response = self.client.get('/catalog_api/top-rated/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [entry['title'] for entry in response.data['results']]
+
+    def test_scores_are_weighted_by_votes(self):
+        refresh_leaderboard()
+
+        # One 10 is pulled toward the mean and ranks below six 9s
+        self.assertEqual(self.titles(), ['Many Nines', 'One Ten', 'Many Sevens'])
+        entry = LeaderboardEntry.objects.get(anime=self.anime['One Ten'])
+        self.assertEqual((entry.votes, entry.average), (1, 10))
+        self.assertLess(entry.score, 9)
+
+    def test_reviews_count_as_votes(self):
+        Review.objects.create(
+            anime=self.anime['Unrated'], user=self.profiles[0], storyline=5, characters=5, artwork=5,
+            sound_series=5, final_grade=5, text='x' * 150,
+        )
+        refresh_leaderboard()
+
+        entry = LeaderboardEntry.objects.get(anime=self.anime['Unrated'])
+        self.assertEqual((entry.votes, entry.average), (1, 10))
+
+    def test_filters(self):
+        refresh_leaderboard()
+
+        self.assertEqual(self.titles(year=2020), ['Many Nines', 'Many Sevens'])
+        self.assertEqual(self.titles(studio='Studio 2'), ['Many Sevens'])
+        self.assertEqual(self.titles(genres='Action'), ['Many Nines', 'One Ten'])
+        self.assertEqual(self.titles(genres=['Action', 'Missing'], genres_mode='all'), [])
+
+    def test_refresh_writes_only_changes(self):
+        refresh_leaderboard()
+        self.assertEqual(self.titles(), ['Many Nines', 'One Ten', 'Many Sevens'])
+
+        self.assertEqual(refresh_leaderboard()['updated'], 0)
+
+        Rating.objects.filter(for_anime=self.anime['One Ten']).delete()
+        result = refresh_leaderboard()
+        self.assertEqual((result['created'], result['deleted']), (0, 1))
+
+        # The cached anonymous response is dropped
+        self.assertEqual(self.titles(), ['Many Nines', 'Many Sevens'])
+
+
+class ReviewAggregateTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        studio = Studio.objects.create(title='Studio 1')
+        self.anime = Anime.objects.create(
+            title='Test Anime',
+            description='Test description',
+            type='TV',
+            episodes=12,
+            ready_episodes=12,
+            length_of_episodes=24,
+            status='Ongoing',
+            age_rating='PG-13',
+            studio=studio,
+            year=2022,
+        )
+        self.profiles = []
+        for number in range(2):
+            user = User.objects.create_user(username=f'user{number}', password='testpassword')
+            self.profiles.append(Profile.objects.create(
+                user=user, nickname=f'User{number}', birth_date='1990-06-06', sex='male', bio='',
+            ))
+        self.url = f'/catalog_api/anime-retrieve/{self.anime.id}/review-scores/'
+
+    def create_review(self, profile, grade, **grades):
+        fields = {'storyline': grade, 'characters': grade, 'artwork': grade, 'sound_series': grade, 'final_grade': grade}
+        fields.update(grades)
+        return Review.objects.create(anime=self.anime, user=profile, text='x' * 150, **fields)
+
+    def assert_matches_rebuild(self):
+        summary = ReviewAggregate.objects.get(anime=self.anime).summary()
+        call_command('rebuild_review_aggregates', stdout=StringIO())
+        self.assertEqual(ReviewAggregate.objects.get(anime=self.anime).summary(), summary)
+
+    def test_aggregate_follows_create_update_delete(self):
+        review = self.create_review(self.profiles[0], 4, artwork=5)
+        self.create_review(self.profiles[1], 2)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(response.data['dimensions']['storyline'], {'average': 3, 'histogram': {1: 0, 2: 1, 3: 0, 4: 1, 5: 0}})
+        self.assertEqual(response.data['dimensions']['artwork']['average'], 3.5)
+        self.assert_matches_rebuild()
+
+        review = Review.objects.get(pk=review.pk)
+        review.final_grade = 1
+        review.save()
+        self.assertEqual(ReviewAggregate.objects.get(anime=self.anime).histogram('final_grade'), {1: 1, 2: 1, 3: 0, 4: 0, 5: 0})
+        self.assert_matches_rebuild()
+
+        review.delete()
+        aggregate = ReviewAggregate.objects.get(anime=self.anime)
+        self.assertEqual((aggregate.count, aggregate.average('final_grade')), (1, 2))
+        self.assert_matches_rebuild()
+
+    def test_upsert_updates_aggregate(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.profiles[0].user)}')
+        data = {'storyline': 5, 'characters': 5, 'artwork': 5, 'sound_series': 5, 'final_grade': 5, 'text': 'x' * 150}
+        url = f'/catalog_api/anime-retrieve/{self.anime.id}/review/'
+
+        self.client.put(url, data, format='json')
+        self.client.put(url, data, format='json')
+        self.client.put(url, {**data, 'final_grade': 3}, format='json')
+
+        aggregate = ReviewAggregate.objects.get(anime=self.anime)
+        self.assertEqual((aggregate.count, aggregate.average('final_grade'), aggregate.average('storyline')), (1, 3, 5))
+        self.assert_matches_rebuild()
+
+    def test_anime_without_reviews(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 0)
+        self.assertIsNone(response.data['dimensions']['final_grade']['average'])
+
+        response = self.client.get('/catalog_api/anime-retrieve/0/review-scores/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TrendingAPITest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.profile = Profile.objects.create(
+            user=self.user,
+            nickname='TestUser',
+            birth_date='1990-06-06',
+            sex='male',
+            bio='',
+        )
+        studio = Studio.objects.create(title='Studio 1')
+        self.anime = [
+            Anime.objects.create(
+                title=f'Anime {number}',
+                description='Test description',
+                type='TV',
+                episodes=12,
+                ready_episodes=12,
+                length_of_episodes=24,
+                status='Ongoing',
+                age_rating='PG-13',
+                studio=studio,
+                year=2022,
+            )
+            for number in range(3)
+        ]
+
+    def counts(self):
+        return dict(ActivityBucket.objects.filter(bucket=current_bucket()).values_list('anime_id', 'count'))
+
+    def test_writes_are_counted(self):
+        # Counted once the writes commit
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(anime=self.anime[0], user=self.profile, text='First')
+            Comment.objects.create(anime=self.anime[0], user=self.profile, text='Second')
+            rating = Rating.objects.create(for_anime=self.anime[1], for_user=self.profile, rate=5)
+            rating.save()
+            Review.objects.create(
+                anime=self.anime[1], user=self.profile, storyline=4, characters=4, artwork=4,
+                sound_series=4, final_grade=4, text='x' * 150,
+            )
+            collection = Collection.objects.create(name='Favourites', user=self.profile)
+            collection.items.add(self.anime[0], self.anime[2])
+            self.assertEqual(self.counts(), {})
+
+        self.assertEqual(self.counts(), {self.anime[0].id: 4, self.anime[1].id: 4, self.anime[2].id: 2})
+
+    def test_rolled_back_writes_are_not_counted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Comment.objects.create(anime=self.anime[0], user=self.profile, text='Rolled back')
+                transaction.set_rollback(True)
+
+        self.assertEqual(self.counts(), {})
+
+    def test_upserts_are_counted(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(2):
+                self.client.put(f'/catalog_api/anime-retrieve/{self.anime[0].id}/rating/', {'rate': 7}, format='json')
+            self.client.post('/catalog_api/rating-bulk/', {'ratings': [{'for_anime': 'Anime 1', 'rate': 3}]}, format='json')
+
+        # The repeated PUT changed nothing
+        self.assertEqual(self.counts(), {self.anime[0].id: 1, self.anime[1].id: 1})
+
+    def test_recent_activity_outranks_older(self):
+        now = current_bucket()
+        ActivityBucket.objects.bulk_create([
+            ActivityBucket(anime=self.anime[0], bucket=now - 48, count=10),
+            ActivityBucket(anime=self.anime[1], bucket=now, count=3),
+            ActivityBucket(anime=self.anime[2], bucket=now - 24 * 30, count=100),
+        ])
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/catalog_api/trending/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([anime['title'] for anime in response.data], ['Anime 1', 'Anime 0'])
+        self.assertEqual([anime['score'] for anime in response.data], [3, 2.5])
+
+        self.assertEqual(prune_activity(), 1)
+        self.assertEqual(self.client.get('/catalog_api/trending/', {'limit': 1}).data[0]['title'], 'Anime 1')
+
+    def test_invalid_limit(self):
+        for limit in ('0', '51', 'x'):
+            response = self.client.get('/catalog_api/trending/', {'limit': limit})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
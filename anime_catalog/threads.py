@@ -0,0 +1,90 @@
+from collections import Counter
+from functools import reduce
+from operator import or_
+from django.db import transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from .models import Comment, path_segment
+
+
+MAX_THREAD_DEPTH = 10
+MAX_THREAD_REPLIES = 50
+
+
+def fetch_descendants(roots, max_depth, max_replies):
+    # Replies under the roots down to max_depth levels below them, in one query on the path index.
+    # Only the first max_replies replies of each comment are read (ROW_NUMBER over its siblings in path
+    # order, i.e. by id), so a busy thread costs no more than a quiet one.
+    # Comments without a path were never backfilled and would match everything
+    roots = [root for root in roots if root.path]
+    if not roots or max_depth < 1 or max_replies < 1:
+        return []
+
+    subtrees = reduce(or_, [
+        Q(path__startswith=root.path, depth__gt=root.depth, depth__lte=root.depth + max_depth) for root in roots
+    ])
+    queryset = Comment.objects.filter(subtrees).select_related('user').annotate(
+        sibling_rank=Window(RowNumber(), partition_by=F('parent_id'), order_by=F('path').asc()),
+    )
+    return list(queryset.filter(sibling_rank__lte=max_replies).order_by('path'))
+
+
+def build_tree(nodes, root_ids):
+    # O(n) over serialized comments: each node is attached to its parent through a dict lookup.
+    # Replies are attached in the order given (fetch_descendants returns path order, so siblings by id);
+    # replies of comments cut by fetch_descendants have no parent here and are dropped.
+    by_id = {}
+    for node in nodes:
+        node['replies'] = []
+        by_id[node['id']] = node
+
+    for node in nodes:
+        parent = by_id.get(node['parent'])
+        if parent is not None:
+            parent['replies'].append(node)
+
+    return [by_id[root_id] for root_id in root_ids]
+
+
+def backfill_comment_paths(batch_size=1000):
+    # Level by level from the roots, so every parent's path is final before its replies are computed
+    updated = 0
+    with transaction.atomic():
+        Comment.objects.update(path='', depth=0)
+
+        depth = 0
+        level = Comment.objects.filter(parent__isnull=True)
+        while True:
+            batch, processed = [], 0
+            for pk, parent_path in level.values_list('id', 'parent__path').iterator(chunk_size=batch_size):
+                batch.append(Comment(id=pk, path=(parent_path or '') + path_segment(pk), depth=depth))
+                if len(batch) == batch_size:
+                    Comment.objects.bulk_update(batch, ['path', 'depth'])
+                    processed += len(batch)
+                    batch = []
+            if batch:
+                Comment.objects.bulk_update(batch, ['path', 'depth'])
+                processed += len(batch)
+
+            if not processed:
+                break
+            updated += processed
+            depth += 1
+            # Replies of the level just written; replies of unwritten comments still see an empty parent path
+            level = Comment.objects.filter(parent__depth=depth - 1).exclude(parent__path='')
+
+        recount_replies(batch_size)
+
+    return updated
+
+
+def recount_replies(batch_size=1000):
+    # Every comment adds one to each ancestor named in its path
+    counts = Counter()
+    for comment in Comment.objects.only('path').exclude(path='').iterator(chunk_size=batch_size):
+        counts.update(comment.get_ancestor_ids())
+
+    Comment.objects.update(reply_count=0)
+    Comment.objects.bulk_update(
+        [Comment(id=pk, reply_count=count) for pk, count in counts.items()], ['reply_count'], batch_size=batch_size
+    )
@@ -5,12 +5,21 @@ from . import views
 urlpatterns = [
     path('short-anime/', views.ShortAnimeListAPIView.as_view(), name='short-anime-list'),
     path('full-anime/', views.FullAnimeListAPIView.as_view(), name='full-anime-list'),
+    path('search/', views.AnimeSearchAPIView.as_view(), name='anime-search'),
+    path('top-rated/', views.TopRatedAPIView.as_view(), name='top-rated'),
+    path('trending/', views.TrendingAPIView.as_view(), name='trending'),
+    path('autocomplete/', views.AutocompleteAPIView.as_view(), name='autocomplete'),
     path('anime-create/', views.AnimeCreateAPIView.as_view(), name='anime-create'),
+    path('anime-import/', views.AnimeImportAPIView.as_view(), name='anime-import'),
+    path('anime-export/', views.AnimeExportAPIView.as_view(), name='anime-export'),
     path('anime-update/<int:pk>/', views.AnimeUpdateAPIView.as_view(), name='anime-update'),
     path('anime-delete/<int:pk>/', views.AnimeDeleteAPIView.as_view(), name='anime-delete'),
     path('anime-retrieve/<int:pk>/', views.AnimeRetrieveAPIView.as_view(), name='anime-retrieve'),
     path('anime-retrieve/<int:pk>/average-rating/', views.AnimeAverageRatingView.as_view(), name='anime-average-rating'),
     path('anime-retrieve/<int:pk>/rating-count/', views.AnimeRatingDistributionView.as_view(), name='anime-rating-distribution'),
+    path('anime-retrieve/<int:pk>/review-scores/', views.AnimeReviewScoresView.as_view(), name='anime-review-scores'),
+    path('anime-retrieve/<int:pk>/rating/', views.RatingUpsertAPIView.as_view(), name='anime-rating-upsert'),
+    path('anime-retrieve/<int:pk>/review/', views.ReviewUpsertAPIView.as_view(), name='anime-review-upsert'),
     path('genre-list/', views.GenreListAPIView.as_view(), name='genre-list'),
     path('genre-retrieve/<int:pk>/', views.GenreRetrieveAPIView.as_view(), name='genre-retrieve'),
     path('genre-create/', views.GenreCreateAPIView.as_view(), name='genre-create'),
@@ -21,14 +30,17 @@ urlpatterns = [
     path('studio-update/<int:pk>/', views.StudioUpdateAPIView.as_view(), name='studio-update'),
     path('studio-delete/<int:pk>/', views.StudioDeleteAPIView.as_view(), name='studio-delete'),
     path('rating-create/', views.RatingCreateAPIView.as_view(), name='rating-create'),
+    path('rating-bulk/', views.RatingBulkAPIView.as_view(), name='rating-bulk'),
     path('rating-update/<int:pk>/', views.RatingUpdateAPIView.as_view(), name='rating-update'),
     path('rating-delete/<int:pk>/', views.RatingDeleteAPIView.as_view(), name='rating-delete'),
     path('collection-list/', views.CollectionListAPIView.as_view(), name='collection-list'),
     path('collection-create/', views.CollectionCreateAPIView.as_view(), name='collection-create'),
     path('collection-update/<int:pk>/', views.CollectionUpdateAPIView.as_view(), name='collection-update'),
     path('collection-delete/<int:pk>/', views.CollectionDeleteAPIView.as_view(), name='collection-delete'),
+    path('anime-retrieve/<int:pk>/comments/', views.CommentThreadAPIView.as_view(), name='anime-comment-thread'),
     path('comment-list/', views.CommentListAPIView.as_view(), name='comment-list'),
     path('comment-retrieve/<int:pk>/', views.CommentRetrieveAPIView.as_view(), name='comment-detail'),
+    path('comment-retrieve/<int:pk>/replies/', views.CommentSubtreeAPIView.as_view(), name='comment-subtree'),
     path('comment-create/', views.CommentCreateAPIView.as_view(), name='comment-create'),
     path('comment-update/<int:pk>/', views.CommentUpdateAPIView.as_view(), name='comment-update'),
     path('comment-delete/<int:pk>/', views.CommentDeleteAPIView.as_view(), name='comment-delete'),
@@ -38,4 +50,5 @@ urlpatterns = [
     path('review-update/<int:pk>/', views.ReviewUpdateAPIView.as_view(), name='review-update'),
     path('review-delete/<int:pk>/', views.ReviewDeleteAPIView.as_view(), name='review-delete'),
     path('register/', views.UserRegistrationView.as_view(), name='user-registration'),
+    path('cache-stats/', views.CacheStatsAPIView.as_view(), name='cache-stats'),
 ]
@@ -1,53 +1,135 @@
-from django.db.models import Avg, Count
 from rest_framework.generics import ListAPIView, CreateAPIView, RetrieveUpdateAPIView, RetrieveDestroyAPIView, \
     RetrieveAPIView, get_object_or_404
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
-from .models import Anime, Genre, Studio, Rating, Profile, Collection, Comment, Review
+from .models import Anime, Genre, Studio, Rating, RatingAggregate, Collection, Comment, Review, LeaderboardEntry, \
+    ReviewAggregate
 from . import serializers
 from rest_framework import permissions, status
+from .activity import TRENDING_MAX_LIMIT, get_trending
+from .aggregates import upsert_ratings
+from .authentication import CatalogRefreshToken
+from .cache import CachedResponseMixin, get_stats
+from .exporter import CONTENT_TYPES, export_anime
+from .filters import filter_anime, filter_by_anime, filter_leaderboard
+from .importer import import_anime
+from .search import AUTOCOMPLETE_MAX_LIMIT, AUTOCOMPLETE_MODELS, autocomplete, search_anime, tokenize
+from .threads import MAX_THREAD_DEPTH, MAX_THREAD_REPLIES, build_tree, fetch_descendants
 from .permissons import IsModerator, IsRatingOwner, IsCollectionOwner, IsCommentOwner, IsReviewOwner
 from .serializers import AnimeAverageRatingSerializer, UserRegistrationSerializer, RatingSerializer, \
-    CollectionSerializer, CommentSerializer, CommentReadOnlySerializer, ReviewReadOnlySerializer, ReviewSerializer
+    CollectionSerializer, CommentSerializer, CommentReadOnlySerializer, ReviewReadOnlySerializer, ReviewSerializer, \
+    RatingBatchSerializer, RatingRateSerializer, ReviewUpsertSerializer
 
 
-class ShortAnimeListAPIView(ListAPIView):
+class EagerLoadingQuerysetMixin:
+    # Hooked into filter_queryset so it also applies to views overriding get_queryset.
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer_class = self.get_serializer_class()
+
+        if hasattr(serializer_class, 'setup_eager_loading'):
+            queryset = serializer_class.setup_eager_loading(queryset)
+        return queryset
+
+
+class OwnedObjectMixin:
+    # Object lookup and ownership in one query; other users' objects are simply not found.
+    owner_field = 'user'
+
+    def get_queryset(self):
+        return super().get_queryset().filter(**{f'{self.owner_field}_id': self.request.profile.pk})
+
+
+class ShortAnimeListAPIView(CachedResponseMixin, EagerLoadingQuerysetMixin, ListAPIView):
+    cache_dependencies = ('anime', 'studio')
     queryset = Anime.objects.all().order_by('-id')
     serializer_class = serializers.ShortAnimeSerializer
     permission_classes = [permissions.AllowAny]
 
 
-class FullAnimeListAPIView(ListAPIView):
+class FullAnimeListAPIView(CachedResponseMixin, EagerLoadingQuerysetMixin, ListAPIView):
+    cache_dependencies = ('anime', 'studio', 'genre')
     serializer_class = serializers.FullAnimeSerializer
     permission_classes = [permissions.AllowAny]
 
     def get_queryset(self):
         queryset = Anime.objects.all().order_by('-id')
-        studio = self.request.query_params.get('studio')
-        genres = self.request.query_params.getlist('genres')
-        status = self.request.query_params.get('status')
-        age_rating = self.request.query_params.get('age_rating')
-        year = self.request.query_params.get('year')
-        type = self.request.query_params.get('type')
-
-        if studio:
-            queryset = queryset.filter(studio__title=studio)
-        if genres:
-            queryset = queryset.filter(genres__title__in=genres)
-        if status:
-            queryset = queryset.filter(status=status)
-        if age_rating:
-            queryset = queryset.filter(age_rating=age_rating)
-        if year:
-            queryset = queryset.filter(year=year)
-        if type:
-            queryset = queryset.filter(type=type)
+        return filter_anime(queryset, self.request.query_params)
 
-        return queryset
+
+class AnimeSearchAPIView(CachedResponseMixin, EagerLoadingQuerysetMixin, ListAPIView):
+    cache_dependencies = ('anime', 'studio')
+    serializer_class = serializers.AnimeSearchSerializer
+    permission_classes = [permissions.AllowAny]
+
+    def get_queryset(self):
+        query = self.request.query_params.get('q', '')
+        if not tokenize(query):
+            raise ValidationError({'q': 'A search query is required.'})
+
+        return search_anime(query)
+
+
+class TopRatedAPIView(CachedResponseMixin, EagerLoadingQuerysetMixin, ListAPIView):
+    # Served from the precomputed leaderboard, see leaderboard.py
+    cache_dependencies = ('leaderboard', 'anime', 'studio', 'genre')
+    serializer_class = serializers.LeaderboardEntrySerializer
+    permission_classes = [permissions.AllowAny]
+
+    def get_queryset(self):
+        queryset = LeaderboardEntry.objects.all().order_by('-score', '-id')
+        return filter_leaderboard(queryset, self.request.query_params)
 
 
-class AnimeRetrieveAPIView(RetrieveAPIView):
+class TrendingAPIView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            raise ValidationError({'limit': 'A valid integer is required.'})
+        if not 1 <= limit <= TRENDING_MAX_LIMIT:
+            raise ValidationError({'limit': f'Must be between 1 and {TRENDING_MAX_LIMIT}.'})
+
+        trending = get_trending(limit)
+        anime = Anime.objects.select_related('studio').in_bulk([anime_id for anime_id, _ in trending])
+        results = []
+        for anime_id, score in trending:
+            if anime_id in anime:
+                anime[anime_id].score = score
+                results.append(anime[anime_id])
+        return Response(serializers.TrendingAnimeSerializer(results, many=True, context={'request': request}).data)
+
+
+class AutocompleteAPIView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        if not tokenize(query):
+            raise ValidationError({'q': 'A search query is required.'})
+
+        kinds = request.query_params.getlist('kind')
+        unknown = [kind for kind in kinds if kind not in AUTOCOMPLETE_MODELS]
+        if unknown:
+            raise ValidationError({'kind': f"Must be one of: {', '.join(AUTOCOMPLETE_MODELS)}."})
+
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            raise ValidationError({'limit': 'A valid integer is required.'})
+        if not 1 <= limit <= AUTOCOMPLETE_MAX_LIMIT:
+            raise ValidationError({'limit': f'Must be between 1 and {AUTOCOMPLETE_MAX_LIMIT}.'})
+
+        return Response(autocomplete(query, kinds, limit))
+
+
+class AnimeRetrieveAPIView(CachedResponseMixin, EagerLoadingQuerysetMixin, RetrieveAPIView):
+    cache_dependencies = ('studio', 'genre')
+    cache_object_dependency = 'anime'
     queryset = Anime.objects.all().order_by('-id')
     serializer_class = serializers.FullAnimeSerializer
     permission_classes = [permissions.AllowAny]
@@ -59,25 +141,56 @@ class AnimeCreateAPIView(CreateAPIView):
     permission_classes = [permissions.IsAuthenticated, (permissions.IsAdminUser | IsModerator)]
 
 
-class AnimeUpdateAPIView(RetrieveUpdateAPIView):
+class AnimeImportAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated, (permissions.IsAdminUser | IsModerator)]
+    max_rows = 5000
+
+    def post(self, request):
+        rows = request.data
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValidationError({'non_field_errors': 'A list of anime objects is required.'})
+        if len(rows) > self.max_rows:
+            raise ValidationError({'non_field_errors': f'At most {self.max_rows} rows per request; use the import_anime command for larger files.'})
+
+        result = import_anime(rows)
+        return Response(result, status=status.HTTP_201_CREATED if result['created'] else status.HTTP_200_OK)
+
+
+class AnimeExportAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated, (permissions.IsAdminUser | IsModerator)]
+
+    def get(self, request):
+        # ?format= is taken by DRF's renderer override
+        output = request.query_params.get('output', 'jsonl')
+        if output not in CONTENT_TYPES:
+            raise ValidationError({'output': f"Must be one of: {', '.join(CONTENT_TYPES)}."})
+
+        response = StreamingHttpResponse(export_anime(output), content_type=CONTENT_TYPES[output])
+        response['Content-Disposition'] = f'attachment; filename="anime.{output}"'
+        return response
+
+
+class AnimeUpdateAPIView(EagerLoadingQuerysetMixin, RetrieveUpdateAPIView):
     queryset = Anime.objects.all().order_by('-id')
     serializer_class = serializers.FullAnimeSerializer
     permission_classes = [permissions.IsAuthenticated, (permissions.IsAdminUser | IsModerator)]
 
 
-class AnimeDeleteAPIView(RetrieveDestroyAPIView):
+class AnimeDeleteAPIView(EagerLoadingQuerysetMixin, RetrieveDestroyAPIView):
     queryset = Anime.objects.all().order_by('-id')
     serializer_class = serializers.FullAnimeSerializer
     permission_classes = [permissions.IsAuthenticated, (permissions.IsAdminUser | IsModerator)]
 
 
-class GenreListAPIView(ListAPIView):
+class GenreListAPIView(CachedResponseMixin, EagerLoadingQuerysetMixin, ListAPIView):
+    cache_dependencies = ('genre',)
     queryset = Genre.objects.all().order_by('-id')
     serializer_class = serializers.GenreSerializer
     permission_classes = [permissions.AllowAny]
 
 
-class GenreRetrieveAPIView(RetrieveAPIView):
+class GenreRetrieveAPIView(CachedResponseMixin, EagerLoadingQuerysetMixin, RetrieveAPIView):
+    cache_dependencies = ('genre',)
     queryset = Genre.objects.all().order_by('-id')
     serializer_class = serializers.GenreSerializer
     permission_classes = [permissions.AllowAny]
@@ -89,19 +202,20 @@ class GenreCreateAPIView(CreateAPIView):
     permission_classes = [permissions.IsAuthenticated, (permissions.IsAdminUser | IsModerator)]
 
 
-class GenreUpdateAPIView(RetrieveUpdateAPIView):
+class GenreUpdateAPIView(EagerLoadingQuerysetMixin, RetrieveUpdateAPIView):
     queryset = Genre.objects.all().order_by('-id')
     serializer_class = serializers.GenreSerializer
     permission_classes = [permissions.IsAuthenticated, (permissions.IsAdminUser | IsModerator)]
 
 
-class GenreDeleteAPIView(RetrieveDestroyAPIView):
+class GenreDeleteAPIView(EagerLoadingQuerysetMixin, RetrieveDestroyAPIView):
     queryset = Genre.objects.all().order_by('-id')
     serializer_class = serializers.GenreSerializer
     permission_classes = [permissions.IsAuthenticated, (permissions.IsAdminUser | IsModerator)]
 
 
-class StudioListAPIView(ListAPIView):
+class StudioListAPIView(CachedResponseMixin, EagerLoadingQuerysetMixin, ListAPIView):
+    cache_dependencies = ('studio',)
     queryset = Studio.objects.all().order_by('-id')
     serializer_class = serializers.StudioSerializer
     permission_classes = [permissions.AllowAny]
@@ -113,24 +227,33 @@ class StudioCreateAPIView(CreateAPIView):
     permission_classes = [permissions.IsAuthenticated, (permissions.IsAdminUser | IsModerator)]
 
 
-class StudioUpdateAPIView(RetrieveUpdateAPIView):
+class StudioUpdateAPIView(EagerLoadingQuerysetMixin, RetrieveUpdateAPIView):
     queryset = Studio.objects.all().order_by('-id')
     serializer_class = serializers.StudioSerializer
     permission_classes = [permissions.IsAuthenticated, (permissions.IsAdminUser | IsModerator)]
 
 
-class StudioDeleteAPIView(RetrieveDestroyAPIView):
+class StudioDeleteAPIView(EagerLoadingQuerysetMixin, RetrieveDestroyAPIView):
     queryset = Studio.objects.all().order_by('-id')
     serializer_class = serializers.StudioSerializer
     permission_classes = [permissions.IsAuthenticated, (permissions.IsAdminUser | IsModerator)]
 
 
+def get_aggregate(model, pk):
+    # Anime created without signals (e.g. a raw bulk_create) have no aggregate row yet: read them as empty
+    aggregate = model.objects.filter(pk=pk).first()
+    if aggregate is None:
+        anime = get_object_or_404(Anime.objects.only('id'), pk=pk)
+        aggregate = model(anime=anime)
+    return aggregate
+
+
 class AnimeAverageRatingView(APIView):
     permission_classes = [permissions.AllowAny]
 
     def get(self, request, pk):
-        anime = get_object_or_404(Anime, pk=pk)
-        average_rating = Rating.objects.filter(for_anime=anime).aggregate(Avg('rate'))['rate__avg']
+        aggregate = get_aggregate(RatingAggregate, pk)
+        average_rating = aggregate.average
 
         if average_rating is not None:
             serializer = AnimeAverageRatingSerializer({'average_rating': average_rating})
@@ -143,16 +266,23 @@ class AnimeRatingDistributionView(APIView):
     permission_classes = [permissions.AllowAny]
 
     def get(self, request, pk):
-        anime = get_object_or_404(Anime, pk=pk)
-        rating_distribution = Rating.objects.filter(for_anime=anime).values('rate').annotate(count=Count('rate')).order_by('rate')
+        aggregate = get_aggregate(RatingAggregate, pk)
+        return Response(aggregate.distribution())
+
+
+class AnimeReviewScoresView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, pk):
+        aggregate = get_aggregate(ReviewAggregate, pk)
+        return Response(aggregate.summary())
 
-        rating_data = {}
-        for item in rating_distribution:
-            rating = item['rate']
-            count = item['count']
-            rating_data[rating] = count
 
-        return Response(rating_data)
+class CacheStatsAPIView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(get_stats())
 
 
 class UserRegistrationView(APIView):
@@ -162,7 +292,7 @@ class UserRegistrationView(APIView):
         serializer = UserRegistrationSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
-            refresh = RefreshToken.for_user(user)
+            refresh = CatalogRefreshToken.for_user(user)
             return Response({
                 'access_token': str(refresh.access_token),
                 'refresh_token': str(refresh),
@@ -176,29 +306,59 @@ class RatingCreateAPIView(CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
 
-class RatingUpdateAPIView(RetrieveUpdateAPIView):
+class RatingBulkAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = RatingBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # Later pairs for the same title win; titles are resolved in one IN query
+        rates = {item['for_anime']: item['rate'] for item in serializer.validated_data['ratings']}
+        anime_ids = dict(Anime.objects.filter(title__in=rates).values_list('title', 'id'))
+
+        result = upsert_ratings(request.profile.pk, {anime_ids[title]: rate for title, rate in rates.items() if title in anime_ids})
+        result['unknown'] = [title for title in rates if title not in anime_ids]
+        return Response(result)
+
+
+class RatingUpsertAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def put(self, request, pk):
+        anime = get_object_or_404(Anime.objects.only('title'), pk=pk)
+        serializer = RatingRateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # Safe to retry: the same PUT always leaves one rating with this rate
+        rate = serializer.validated_data['rate']
+        upsert_ratings(request.profile.pk, {anime.pk: rate})
+        return Response({'for_anime': anime.title, 'rate': rate})
+
+
+class RatingUpdateAPIView(OwnedObjectMixin, EagerLoadingQuerysetMixin, RetrieveUpdateAPIView):
+    owner_field = 'for_user'
     queryset = Rating.objects.all().order_by('-id')
     serializer_class = RatingSerializer
     permission_classes = [permissions.IsAuthenticated, IsRatingOwner]
 
     def perform_update(self, serializer):
-        profile = Profile.objects.filter(user=self.request.user).first()
-        serializer.save(for_user=profile)
+        serializer.save(for_user=self.request.profile)
 
 
-class RatingDeleteAPIView(RetrieveDestroyAPIView):
+class RatingDeleteAPIView(OwnedObjectMixin, EagerLoadingQuerysetMixin, RetrieveDestroyAPIView):
+    owner_field = 'for_user'
     queryset = Rating.objects.all().order_by('-id')
     serializer_class = RatingSerializer
     permission_classes = [permissions.IsAuthenticated, IsRatingOwner]
 
 
-class CollectionListAPIView(ListAPIView):
+class CollectionListAPIView(EagerLoadingQuerysetMixin, ListAPIView):
     serializer_class = CollectionSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        user = Profile.objects.filter(user=self.request.user).first()
-        return Collection.objects.filter(user=user)
+        return Collection.objects.filter(user_id=self.request.profile.pk).order_by('-id')
 
 
 class CollectionCreateAPIView(CreateAPIView):
@@ -207,30 +367,72 @@ class CollectionCreateAPIView(CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
 
-class CollectionUpdateAPIView(RetrieveUpdateAPIView):
+class CollectionUpdateAPIView(OwnedObjectMixin, EagerLoadingQuerysetMixin, RetrieveUpdateAPIView):
     queryset = Collection.objects.all().order_by('-id')
     serializer_class = CollectionSerializer
     permission_classes = [permissions.IsAuthenticated, IsCollectionOwner]
 
 
-class CollectionDeleteAPIView(RetrieveDestroyAPIView):
+class CollectionDeleteAPIView(OwnedObjectMixin, EagerLoadingQuerysetMixin, RetrieveDestroyAPIView):
     queryset = Collection.objects.all().order_by('-id')
     serializer_class = CollectionSerializer
     permission_classes = [permissions.IsAuthenticated, IsCollectionOwner]
 
 
-class CommentListAPIView(ListAPIView):
+class CommentListAPIView(EagerLoadingQuerysetMixin, ListAPIView):
     serializer_class = CommentReadOnlySerializer
     permission_classes = [permissions.AllowAny]
 
     def get_queryset(self):
         queryset = Comment.objects.all().order_by('-id')
-        anime = self.request.query_params.get('anime')
+        return filter_by_anime(queryset, self.request.query_params)
+
+
+def get_thread_limits(request):
+    limits = []
+    for name, default, maximum in (('max_depth', 3, MAX_THREAD_DEPTH), ('max_replies', 10, MAX_THREAD_REPLIES)):
+        try:
+            value = int(request.query_params.get(name, default))
+        except ValueError:
+            raise ValidationError({name: 'A valid integer is required.'})
+        if not 0 <= value <= maximum:
+            raise ValidationError({name: f'Must be between 0 and {maximum}.'})
+        limits.append(value)
+    return limits
+
+
+class CommentThreadAPIView(ListAPIView):
+    # Top-level comments of an anime, paginated, each with its replies nested up to max_depth levels
+    # and max_replies per comment. Three queries whatever the thread sizes: page count, roots, replies
+    # (plus a check that the anime exists when it has no comments).
+    serializer_class = serializers.CommentNodeSerializer
+    permission_classes = [permissions.AllowAny]
 
-        if anime:
-            queryset = queryset.filter(anime__title=anime)
+    def get_queryset(self):
+        return Comment.objects.filter(anime_id=self.kwargs['pk'], parent__isnull=True).select_related('user').order_by('-id')
 
-        return queryset
+    def list(self, request, *args, **kwargs):
+        max_depth, max_replies = get_thread_limits(request)
+
+        roots = self.paginate_queryset(self.get_queryset())
+        if not roots:
+            get_object_or_404(Anime.objects.only('id'), pk=self.kwargs['pk'])
+        nodes = self.get_serializer(roots + fetch_descendants(roots, max_depth, max_replies), many=True).data
+        return self.get_paginated_response(build_tree(nodes, [root.id for root in roots]))
+
+
+class CommentSubtreeAPIView(RetrieveAPIView):
+    # A comment with every reply under it, nested: two queries for any thread size
+    queryset = Comment.objects.select_related('user')
+    serializer_class = serializers.CommentNodeSerializer
+    permission_classes = [permissions.AllowAny]
+
+    def retrieve(self, request, *args, **kwargs):
+        max_depth, max_replies = get_thread_limits(request)
+
+        comment = self.get_object()
+        nodes = self.get_serializer([comment] + fetch_descendants([comment], max_depth, max_replies), many=True).data
+        return Response(build_tree(nodes, [comment.id])[0])
 
 
 class CommentCreateAPIView(CreateAPIView):
@@ -239,42 +441,37 @@ class CommentCreateAPIView(CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
 
-class CommentUpdateAPIView(RetrieveUpdateAPIView):
+class CommentUpdateAPIView(OwnedObjectMixin, EagerLoadingQuerysetMixin, RetrieveUpdateAPIView):
     queryset = Comment.objects.all().order_by('-id')
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticated, IsCommentOwner]
 
 
-class CommentDeleteAPIView(RetrieveDestroyAPIView):
+class CommentDeleteAPIView(OwnedObjectMixin, EagerLoadingQuerysetMixin, RetrieveDestroyAPIView):
     queryset = Comment.objects.all().order_by('-id')
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticated, IsCommentOwner]
 
 
-class CommentRetrieveAPIView(RetrieveAPIView):
+class CommentRetrieveAPIView(EagerLoadingQuerysetMixin, RetrieveAPIView):
     queryset = Comment.objects.all().order_by('-id')
     serializer_class = CommentReadOnlySerializer
     permission_classes = [permissions.AllowAny]
 
 
-class ReviewRetrieveAPIView(RetrieveAPIView):
+class ReviewRetrieveAPIView(EagerLoadingQuerysetMixin, RetrieveAPIView):
     queryset = Review.objects.all().order_by('-id')
     serializer_class = ReviewReadOnlySerializer
     permission_classes = [permissions.AllowAny]
 
 
-class ReviewListAPIView(ListAPIView):
+class ReviewListAPIView(EagerLoadingQuerysetMixin, ListAPIView):
     serializer_class = ReviewReadOnlySerializer
     permission_classes = [permissions.AllowAny]
 
     def get_queryset(self):
         queryset = Review.objects.all().order_by('-id')
-        anime = self.request.query_params.get('anime')
-
-        if anime:
-            queryset = queryset.filter(anime__title=anime)
-
-        return queryset
+        return filter_by_anime(queryset, self.request.query_params)
 
 
 class ReviewCreateAPIView(CreateAPIView):
@@ -283,13 +480,24 @@ class ReviewCreateAPIView(CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
 
-class ReviewUpdateAPIView(RetrieveUpdateAPIView):
+class ReviewUpsertAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def put(self, request, pk):
+        anime = get_object_or_404(Anime.objects.only('title'), pk=pk)
+        serializer = ReviewUpsertSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.upsert(anime, request.profile)
+        return Response(serializer.data)
+
+
+class ReviewUpdateAPIView(OwnedObjectMixin, EagerLoadingQuerysetMixin, RetrieveUpdateAPIView):
     queryset = Review.objects.all().order_by('-id')
     serializer_class = ReviewSerializer
     permission_classes = [permissions.IsAuthenticated, IsReviewOwner]
 
 
-class ReviewDeleteAPIView(RetrieveDestroyAPIView):
+class ReviewDeleteAPIView(OwnedObjectMixin, EagerLoadingQuerysetMixin, RetrieveDestroyAPIView):
     queryset = Review.objects.all().order_by('-id')
     serializer_class = ReviewSerializer
     permission_classes = [permissions.IsAuthenticated, IsReviewOwner]
@@ -13,6 +13,7 @@ DB_NAME = config('DB_NAME')
 DB_USER = config('DB_USER')
 DB_PASSWORD = config('DB_PASSWORD')
 DEBUG = config('DEBUG', default=False, cast=bool)
+CACHE_URL = config('CACHE_URL', default='')
 
 
 ALLOWED_HOSTS = [config('ALLOWED_HOSTS')]
@@ -25,6 +26,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'drf_yasg',
     'anime_catalog',
@@ -36,6 +38,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'anime_catalog.middleware.ProfileMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -73,6 +76,29 @@ DATABASES = {
 }
 
 
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=300, cast=int)
+ROLE_CACHE_TIMEOUT = config('ROLE_CACHE_TIMEOUT', default=300, cast=int)
+AUTH_CACHE_TIMEOUT = config('AUTH_CACHE_TIMEOUT', default=60, cast=int)
+PROFILE_CACHE_TIMEOUT = config('PROFILE_CACHE_TIMEOUT', default=300, cast=int)
+# Role claims in access tokens are revoked through the cache, so they are only trusted when every process
+# shares it; otherwise roles are read from the database
+AUTH_TRUST_TOKEN_CLAIMS = config('AUTH_TRUST_TOKEN_CLAIMS', default=bool(CACHE_URL), cast=bool)
+
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -108,7 +134,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'anime_catalog.authentication.StatelessJWTAuthentication',
     ),
     'DEFAULT_RENDERER_CLASSES': [
             'rest_framework.renderers.JSONRenderer',
@@ -116,7 +142,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PARSER_CLASSES': [
             'rest_framework.parsers.JSONParser',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'anime_catalog.pagination.CatalogPagination',
     'PAGE_SIZE': 10,
 }
 
@@ -144,7 +170,7 @@ SIMPLE_JWT = {
 
     "AUTH_TOKEN_CLASSES": ("rest_framework_simplejwt.tokens.AccessToken",),
     "TOKEN_TYPE_CLAIM": "token_type",
-    "TOKEN_USER_CLASS": "rest_framework_simplejwt.models.TokenUser",
+    "TOKEN_USER_CLASS": "anime_catalog.authentication.CatalogTokenUser",
 
     "JTI_CLAIM": "jti",
 
@@ -152,8 +178,8 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_LIFETIME": timedelta(days=31),
     "SLIDING_TOKEN_REFRESH_LIFETIME": timedelta(days=31),
 
-    "TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainPairSerializer",
-    "TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSerializer",
+    "TOKEN_OBTAIN_SERIALIZER": "anime_catalog.serializers.CatalogTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "anime_catalog.serializers.CatalogTokenRefreshSerializer",
     "TOKEN_VERIFY_SERIALIZER": "rest_framework_simplejwt.serializers.TokenVerifySerializer",
     "TOKEN_BLACKLIST_SERIALIZER": "rest_framework_simplejwt.serializers.TokenBlacklistSerializer",
     "SLIDING_TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainSlidingSerializer",
@@ -169,6 +195,21 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 CELERY_TIMEZONE = 'Asia/Almaty'
+CELERY_BEAT_SCHEDULE = {
+    'refresh-leaderboard': {
+        'task': 'anime_catalog.tasks.refresh_leaderboard_task',
+        'schedule': config('LEADERBOARD_REFRESH_INTERVAL', default=600, cast=int),
+    },
+    'prune-activity': {
+        'task': 'anime_catalog.tasks.prune_activity_task',
+        'schedule': config('ACTIVITY_PRUNE_INTERVAL', default=3600, cast=int),
+    },
+    # Picks up replies whose scheduled flush was lost or already running when they were buffered
+    'flush-reply-notifications': {
+        'task': 'anime_catalog.tasks.flush_reply_notifications_task',
+        'schedule': config('COMMENT_NOTIFICATION_SWEEP_INTERVAL', default=600, cast=int),
+    },
+}
 
 EMAIL_BACKEND = config('EMAIL_BACKEND')
 EMAIL_USE_TLS = config('EMAIL_USE_TLS')
@@ -176,3 +217,13 @@ EMAIL_HOST = config('EMAIL_HOST')
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 EMAIL_PORT = config('EMAIL_PORT')
+
+SITE_URL = config('SITE_URL', default='http://127.0.0.1:8000')
+# Replies to the same user within this many seconds go out as one digest
+COMMENT_NOTIFICATION_WINDOW = config('COMMENT_NOTIFICATION_WINDOW', default=300, cast=int)
+# Votes an anime needs before its own average outweighs the site-wide mean in the top-rated score
+LEADERBOARD_MIN_VOTES = config('LEADERBOARD_MIN_VOTES', default=10, cast=int)
+# Trending: hourly activity counts over the window, halved in weight every half-life
+TRENDING_WINDOW_HOURS = config('TRENDING_WINDOW_HOURS', default=168, cast=int)
+TRENDING_HALF_LIFE_HOURS = config('TRENDING_HALF_LIFE_HOURS', default=24, cast=int)
+TRENDING_CACHE_TIMEOUT = config('TRENDING_CACHE_TIMEOUT', default=60, cast=int)